@@ -0,0 +1,131 @@
+"""Latency of regular traffic while abusive clients hammer the app.
+
+Measures GET /receipt/ alone, then again while other clients brute-force
+/auth/token and loop POST /receipt/ retries. Each client has its own address,
+so the per-IP limits apply to the abusers only. Run it once as is and once with
+RATE_LIMIT_ENABLED=false LOAD_SHEDDING_MAX_CONCURRENCY=0, then compare both
+reports with benchmarks/compare.py.
+
+    python -m benchmarks.abuse --duration 20 --output abuse.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.run import build_requests, login, make_receipt, run_phase, seed
+from benchmarks.stats import git_revision
+
+
+async def abuse(clients, context: dict, tokens: dict, args, deadline: float) -> dict:
+    statuses = {}
+
+    async def brute_force(client):
+        return await client.post(
+            "/auth/token", data={"username": random.choice(context["logins"]), "password": "wrong-password"},
+        )
+
+    async def retry_loop(client):
+        return await client.post(
+            "/receipt/",
+            json=make_receipt(context["product_names"], args.lines),
+            headers={"Authorization": f"Bearer {tokens[context['logins'][0]]}"},
+        )
+
+    async def worker(client, request):
+        while time.perf_counter() < deadline:
+            try:
+                status = (await request(client)).status_code
+            except httpx.HTTPError:
+                status = "error"
+            statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(*(
+        worker(clients[index % len(clients)], brute_force if index % 2 else retry_loop)
+        for index in range(args.abuse_concurrency)
+    ))
+    return {str(status): count for status, count in sorted(statuses.items(), key=str)}
+
+
+def make_client(app, address: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, client=(address, 50000)), base_url="http://bench", timeout=60,
+    )
+
+
+async def main(args) -> dict:
+    import main as application
+    from database.config import engine
+
+    async with application.app.router.lifespan_context(application.app):
+        context = await seed(args)
+        # The first user is the misbehaving terminal, the others send the regular traffic.
+        regular_context = {**context, "logins": context["logins"][1:]}
+        clients = [
+            make_client(application.app, f"10.0.0.{index + 1}") for index in range(len(regular_context["logins"]))
+        ]
+        abusers = [make_client(application.app, f"10.1.0.{index + 1}") for index in range(args.abusers)]
+        try:
+            tokens = {
+                name: await login(client, name, args.password)
+                for name, client in zip(context["logins"], abusers[:1] + clients)
+            }
+            requests = build_requests(args, regular_context, tokens)
+
+            def pick():
+                return lambda _: requests["list"](random.choice(clients))
+
+            results = {"baseline": await run_phase(None, pick, args.duration, args.concurrency, None, engine.pool)}
+            deadline = time.perf_counter() + args.duration
+            regular, abusive = await asyncio.gather(
+                run_phase(None, pick, args.duration, args.concurrency, None, engine.pool),
+                abuse(abusers, context, tokens, args, deadline),
+            )
+            results["under_abuse"] = regular
+            results["under_abuse"]["abuse_statuses"] = abusive
+        finally:
+            for client in clients + abusers:
+                await client.aclose()
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "target": "in-process",
+            "users": args.users,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "abusers": args.abusers,
+            "abuse_concurrency": args.abuse_concurrency,
+        },
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="At least 2, the first one sends the abusive retries")
+    parser.add_argument("--products", type=int, default=2_000)
+    parser.add_argument("--receipts", type=int, default=10_000)
+    parser.add_argument("--lines", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--seed-batch-size", type=int, default=500)
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent regular requests")
+    parser.add_argument("--abusers", type=int, default=4, help="Client addresses of the abusive traffic")
+    parser.add_argument("--abuse-concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    arguments = parser.parse_args()
+    random.seed(arguments.seed)
+    report = asyncio.run(main(arguments))
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    print(output)
@@ -0,0 +1,50 @@
+"""Compare two benchmark reports.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+METRICS = (
+    ("throughput_rps", ("throughput_rps",)),
+    ("p50_ms", ("latency_ms", "p50")),
+    ("p95_ms", ("latency_ms", "p95")),
+    ("p99_ms", ("latency_ms", "p99")),
+    ("queries/req", ("db_queries_per_request",)),
+)
+
+
+def lookup(result: dict, path: tuple):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(before: dict, after: dict) -> list:
+    rows = []
+    for scenario, result in after["scenarios"].items():
+        previous = before["scenarios"].get(scenario, {})
+        for metric, path in METRICS:
+            old, new = lookup(previous, path), lookup(result, path)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            rows.append((scenario, metric, old, new, change))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    arguments = parser.parse_args()
+    with open(arguments.before) as file:
+        before_report = json.load(file)
+    with open(arguments.after) as file:
+        after_report = json.load(file)
+
+    print(f"{before_report['meta']['revision']} -> {after_report['meta']['revision']}")
+    for row in compare(before_report, after_report):
+        print("{:<24} {:<15} {:>12.2f} {:>12.2f} {:>+8.1f}%".format(*row))
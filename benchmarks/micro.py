@@ -0,0 +1,150 @@
+"""In-process benchmarks that need no database.
+
+Times receipt rendering, response serialization, total calculation, token
+authentication and password hashing for a range of receipt sizes. Serialization
+is timed for several page sizes with the fast path and with jsonable_encoder,
+which FastAPI uses by default. Total calculation is timed with Decimal amounts
+and with the float arithmetic the money columns used to have.
+
+    python -m benchmarks.micro --output micro.json
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Awaitable, Callable, List
+
+from benchmarks.stats import git_revision, summarize
+
+
+def make_receipt(lines: int) -> dict:
+    products = [
+        {
+            "name": f"Product with a fairly long name {index}",
+            "price": Decimal("12.34") + index,
+            "quantity": index % 5 + 1,
+            "weight": None,
+            "total": (Decimal("12.34") + index) * (index % 5 + 1),
+        }
+        for index in range(lines)
+    ]
+    total = sum(product["total"] for product in products)
+    return {
+        "id": 1,
+        "products": products,
+        "payment": {"type": "cash", "amount": total + 10},
+        "total": total,
+        "rest": Decimal(10),
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "public_token": "00000000-0000-0000-0000-000000000000",
+    }
+
+
+def calculate_float(receipt: dict) -> None:
+    total = 0.0
+    for product in receipt["products"]:
+        amount = float(product["quantity"]) if product["quantity"] is not None else float(product["weight"])
+        product["total"] = round(float(product["price"]) * amount, 2)
+        total += product["total"]
+    receipt["total"] = round(total, 2)
+    receipt["rest"] = round(float(receipt["payment"]["amount"]) - total, 2)
+
+
+def measure(function: Callable[[], object], repeat: int) -> dict:
+    samples: List[float] = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started_at) * 1000)
+    return {"repeat": repeat, "latency_ms": summarize(samples)}
+
+
+async def measure_async(function: Callable[[], Awaitable], repeat: int) -> dict:
+    samples: List[float] = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        await function()
+        samples.append((time.perf_counter() - started_at) * 1000)
+    return {"repeat": repeat, "latency_ms": summarize(samples)}
+
+
+def run(args) -> dict:
+    from fastapi.encoders import jsonable_encoder
+
+    from dto import ReceiptRenderFormat
+    from services import AuthService, ReceiptService, UserService
+    from services.rendering import get_renderer
+    from services.serialization import dumps
+
+    results = {}
+    for lines in args.lines:
+        receipt = make_receipt(lines)
+        for render_format in ReceiptRenderFormat:
+            renderer = get_renderer(render_format, 32)
+            results[f"render_{render_format.value}_{lines}"] = measure(lambda: renderer.render(receipt), args.repeat)
+        for page_size in args.page_sizes:
+            page = {"data": [receipt] * page_size, "count": page_size}
+            results[f"serialize_page_{page_size}_{lines}"] = measure(lambda: dumps(page), args.repeat)
+            results[f"serialize_page_jsonable_{page_size}_{lines}"] = measure(
+                lambda: json.dumps(jsonable_encoder(page), ensure_ascii=False, separators=(",", ":")).encode(),
+                args.repeat,
+            )
+        create = {
+            "products": [{"name": p["name"], "price": p["price"], "quantity": p["quantity"], "weight": None}
+                         for p in receipt["products"]],
+            "payment": receipt["payment"],
+            "total": None,
+            "rest": None,
+        }
+        results[f"calculate_{lines}"] = measure(lambda: ReceiptService._calculate(dict(create)), args.repeat)
+        results[f"calculate_float_{lines}"] = measure(lambda: calculate_float(dict(create)), args.repeat)
+
+    # The identity work of every authenticated request, with user_id in the claims so no query is made.
+    token = AuthService.create_access_token({"login": "bench", "user_id": 1})
+    results["auth_decode"] = measure(lambda: AuthService.decode_token(token), args.repeat)
+
+    async def hashing_and_auth():
+        results["auth_principal"] = await measure_async(
+            lambda: UserService.get_principal(AuthService.decode_token(token)), args.repeat,
+        )
+        results["hash_password"] = await measure_async(
+            lambda: AuthService.hash_password("bench-password"), args.hash_repeat,
+        )
+        hashed = await AuthService.hash_password("bench-password")
+        results["verify_password"] = await measure_async(
+            lambda: AuthService.verify_password("bench-password", hashed), args.hash_repeat,
+        )
+
+    asyncio.run(hashing_and_auth())
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "lines": args.lines,
+            "page_sizes": args.page_sizes,
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="*", default=[10, 100, 1000])
+    parser.add_argument("--page-sizes", type=int, nargs="*", default=[1, 20, 100])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--hash-repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = run(arguments)
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    print(output)
@@ -0,0 +1,169 @@
+"""Recent-range receipt queries over a large partitioned table.
+
+Fills receipts with --rows synthetic rows spread over the last --months months,
+then times ReceiptRepository.get and count for recent windows and reports how
+many partitions each plan touches. Generating 100M rows takes a while and about
+15 GB of disk; pass --skip-seed to reuse an earlier run's data.
+
+    python -m benchmarks.partitions --rows 100000000 --output partitions.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, text
+
+from benchmarks.stats import git_revision, summarize
+
+USER_LOGIN_PREFIX = "bench-partitions-"
+
+
+async def seed(engine, args) -> None:
+    from database.partitions import add_months, create_partitions, month_start
+
+    now = datetime.now(timezone.utc)
+    async with engine.begin() as connection:
+        await create_partitions(connection, add_months(month_start(now.date()), -args.months), month_start(now.date()))
+        await connection.execute(text(
+            "INSERT INTO users (name, login, hashed_password) "
+            "SELECT 'bench', :prefix || g, '-' FROM generate_series(1, :users) g "
+            "ON CONFLICT (login) DO NOTHING"
+        ), {"prefix": USER_LOGIN_PREFIX, "users": args.users})
+
+    user_ids = await get_user_ids(engine)
+    span_seconds = (now - datetime.combine(
+        add_months(month_start(now.date()), -args.months), datetime.min.time(), timezone.utc,
+    )).total_seconds()
+    for start in range(0, args.rows, args.chunk_size):
+        started_at = time.perf_counter()
+        async with engine.begin() as connection:
+            await connection.execute(text(
+                "INSERT INTO receipts (user_id, created_at, total, amount_paid, payment_type, rest, public_token) "
+                "SELECT (CAST(:user_ids AS integer[]))[1 + g % :user_count], "
+                "       now() - make_interval(secs => random() * :span_seconds), "
+                "       total, total, CASE WHEN g % 2 = 0 THEN 'cash' ELSE 'cashless' END, 0, md5(random()::text) "
+                "FROM (SELECT g, round((random() * 1000)::numeric, 2) AS total "
+                "      FROM generate_series(:start, :end) g) rows"
+            ), {
+                "user_ids": user_ids,
+                "user_count": len(user_ids),
+                "span_seconds": span_seconds,
+                "start": start,
+                "end": min(start + args.chunk_size, args.rows) - 1,
+            })
+        print(f"Inserted {min(start + args.chunk_size, args.rows)} rows ({time.perf_counter() - started_at:.1f}s)")
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        await connection.execute(text("ANALYZE receipts"))
+
+
+async def get_user_ids(engine) -> list:
+    from database import User
+
+    async with engine.connect() as connection:
+        return list((await connection.execute(
+            select(User.id).where(User.login.startswith(USER_LOGIN_PREFIX)).order_by(User.id)
+        )).scalars().all())
+
+
+async def partitions_scanned(engine, filters) -> int:
+    from database import Receipt
+    from repositories import ReceiptRepository
+
+    query = ReceiptRepository._apply_filters(select(func.count(Receipt.id)), filters)
+    async with engine.connect() as connection:
+        compiled = query.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+        plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}")).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    relations = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return len(relations)
+
+
+async def main(args) -> dict:
+    from database.config import engine
+    from dto import ReceiptFilters
+    from services import ReceiptService
+    from repositories import ReceiptRepository
+
+    if not args.skip_seed:
+        await seed(engine, args)
+    user_ids = await get_user_ids(engine)
+
+    results = {}
+    for days in args.windows:
+        get_samples, count_samples = [], []
+        for _ in range(args.repeat):
+            filters = ReceiptFilters(
+                user_id=random.choice(user_ids),
+                min_created_at=datetime.now(timezone.utc) - timedelta(days=days),
+                limit=args.page_size,
+            )
+            started_at = time.perf_counter()
+            await ReceiptService.get(filters)
+            get_samples.append((time.perf_counter() - started_at) * 1000)
+            started_at = time.perf_counter()
+            await ReceiptRepository.count(filters)
+            count_samples.append((time.perf_counter() - started_at) * 1000)
+        results[f"get_last_{days}_days"] = {"latency_ms": summarize(get_samples)}
+        results[f"count_last_{days}_days"] = {
+            "latency_ms": summarize(count_samples),
+            "partitions_scanned": await partitions_scanned(engine, filters),
+        }
+    async with engine.connect() as connection:
+        total_rows = (await connection.execute(text(
+            "SELECT reltuples::bigint FROM pg_class WHERE relname = 'receipts'"
+        ))).scalar()
+    await engine.dispose()
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "rows": args.rows,
+            "months": args.months,
+            "users": args.users,
+            "estimated_rows": total_rows,
+            "page_size": args.page_size,
+            "repeat": args.repeat,
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--chunk-size", type=int, default=1_000_000)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--windows", type=int, nargs="*", default=[1, 7, 30], help="Recent windows in days")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    random.seed(arguments.seed)
+    report = asyncio.run(main(arguments))
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    print(output)
@@ -0,0 +1,311 @@
+"""Load test against the app and a real Postgres.
+
+Seeds users, products and receipts, then drives /auth/token, POST /receipt/,
+GET /receipt/ and GET /receipt/{public_token} one scenario at a time and as a
+weighted mix. Results are written as JSON so runs can be compared between
+commits with benchmarks/compare.py.
+
+create_cold empties the product catalog cache before every receipt, to compare
+with the warm create scenario; it only runs in-process. list_offset and
+list_cursor fetch the same page deep in each user's history, by offset and by
+cursor. Seed enough receipts to see the difference, e.g. --receipts 1000000.
+create_lines_<n> repeat the create scenario for each line count of --line-sweep,
+to see how queries per request and latency grow with the size of a receipt.
+
+    python -m benchmarks.run --receipts 10000 --duration 20 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import event
+
+from benchmarks.stats import git_revision, summarize
+
+SCENARIOS = ("auth", "create", "create_cold", "list", "list_offset", "list_cursor", "summary", "public")
+IN_PROCESS_SCENARIOS = ("create_cold",)
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def make_receipt(product_names: List[str], lines: int) -> dict:
+    products = [
+        {"name": name, "price": f"{random.randint(100, 50_000) / 100:.2f}", "quantity": random.randint(1, 5)}
+        for name in random.sample(product_names, min(lines, len(product_names)))
+    ]
+    return {"products": products, "payment": {"type": random.choice(["cash", "cashless"]), "amount": "1000000.00"}}
+
+
+async def seed(args) -> dict:
+    from dto import UserCreate
+    from dto.filters import PaginationFilters
+    from services import ReceiptService, UserService
+    from routes.receipt import ReceiptBatchItemModel
+
+    run_id = uuid.uuid4().hex[:8]
+    product_names = [f"bench-product-{i}" for i in range(args.products)]
+    users = []
+    for index in range(args.users):
+        login = f"bench-{run_id}-{index}"
+        user = await UserService.create(UserCreate(login=login, name=login, password=args.password))
+        users.append(user)
+
+    public_tokens = []
+    deep_pages = {}
+    per_user = max(args.receipts // max(len(users), 1), 1)
+    for user in users:
+        receipt_ids = []
+        for start in range(0, per_user, args.seed_batch_size):
+            items = [
+                ReceiptBatchItemModel.model_validate({
+                    **make_receipt(product_names, args.lines),
+                    "idempotency_key": f"seed-{run_id}-{user['id']}-{start + offset}",
+                }).to_dto()
+                for offset in range(min(args.seed_batch_size, per_user - start))
+            ]
+            results = await ReceiptService.create_batch(items, user["id"])
+            public_tokens.extend(r["receipt"]["public_token"] for r in results if r["receipt"])
+            receipt_ids.extend(r["receipt"]["id"] for r in results if r["receipt"])
+        # The last page by default; the cursor points at the receipt right before the offset.
+        receipt_ids.sort()
+        if args.deep_offset is None:
+            offset = max(len(receipt_ids) - args.page_size, 0)
+        else:
+            offset = min(args.deep_offset, len(receipt_ids))
+        cursor = PaginationFilters.encode_cursor(receipt_ids[offset - 1]) if offset else None
+        deep_pages[user["login"]] = (offset, cursor)
+    return {
+        "logins": [user["login"] for user in users],
+        "product_names": product_names,
+        "public_tokens": random.sample(public_tokens, min(len(public_tokens), 10_000)),
+        "deep_pages": deep_pages,
+    }
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/auth/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def build_requests(args, context: dict, tokens: Dict[str, str]) -> Dict[str, Callable[[httpx.AsyncClient], Awaitable]]:
+    from repositories import ProductRepository
+
+    def headers(login=None):
+        return {"Authorization": f"Bearer {tokens[login or random.choice(context['logins'])]}"}
+
+    async def auth(client):
+        return await client.post(
+            "/auth/token", data={"username": random.choice(context["logins"]), "password": args.password},
+        )
+
+    def create_with_lines(lines):
+        async def create(client):
+            return await client.post(
+                "/receipt/", json=make_receipt(context["product_names"], lines), headers=headers(),
+            )
+        return create
+
+    create = create_with_lines(args.lines)
+
+    async def create_cold(client):
+        ProductRepository.catalog_cache.clear()
+        return await create(client)
+
+    async def list_receipts(client):
+        return await client.get("/receipt/", params={"limit": args.page_size}, headers=headers())
+
+    async def list_offset(client):
+        login = random.choice(context["logins"])
+        offset, _ = context["deep_pages"][login]
+        return await client.get("/receipt/", params={"limit": args.page_size, "offset": offset}, headers=headers(login))
+
+    async def list_cursor(client):
+        login = random.choice(context["logins"])
+        _, cursor = context["deep_pages"][login]
+        params = {"limit": args.page_size, **({"after": cursor} if cursor else {})}
+        return await client.get("/receipt/", params=params, headers=headers(login))
+
+    async def list_summaries(client):
+        return await client.get(
+            "/receipt/", params={"limit": args.page_size, "include_products": "false"}, headers=headers(),
+        )
+
+    async def public(client):
+        return await client.get(f"/receipt/{random.choice(context['public_tokens'])}")
+
+    return {
+        "auth": auth,
+        "create": create,
+        "create_cold": create_cold,
+        "list": list_receipts,
+        "list_offset": list_offset,
+        "list_cursor": list_cursor,
+        "summary": list_summaries,
+        "public": public,
+        **{f"create_lines_{lines}": create_with_lines(lines) for lines in args.line_sweep},
+    }
+
+
+async def run_phase(
+        client: httpx.AsyncClient,
+        pick: Callable[[], Callable[[httpx.AsyncClient], Awaitable]],
+        duration: float,
+        concurrency: int,
+        counter: Optional[QueryCounter],
+        pool,
+) -> dict:
+    latencies = []
+    errors = 0
+    queries_before = counter.count if counter else None
+    checkouts_before = pool.checkouts_total if pool is not None else None
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            request = pick()
+            started_at = time.perf_counter()
+            try:
+                response = await request(client)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started_at) * 1000)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started_at
+
+    result = {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+    }
+    if counter is not None and latencies:
+        result["db_queries_per_request"] = (counter.count - queries_before) / len(latencies)
+    if pool is not None and latencies:
+        result["db_checkouts_per_request"] = (pool.checkouts_total - checkouts_before) / len(latencies)
+    return result
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario '{name}'")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+async def main(args) -> dict:
+    import main as application
+    from database.config import engine
+
+    counter = None if args.base_url else QueryCounter(engine)
+    pool = None if args.base_url else engine.pool
+
+    async with application.app.router.lifespan_context(application.app):
+        context = await seed(args)
+        if args.base_url:
+            client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+        else:
+            client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=application.app), base_url="http://bench", timeout=60,
+            )
+        async with client:
+            tokens = {name: await login(client, name, args.password) for name in context["logins"]}
+            requests = build_requests(args, context, tokens)
+
+            results = {}
+            for name in args.scenarios:
+                if args.base_url and name in IN_PROCESS_SCENARIOS:
+                    continue
+                results[name] = await run_phase(
+                    client, lambda: requests[name], args.duration, args.concurrency, counter, pool,
+                )
+            for lines in args.line_sweep:
+                name = f"create_lines_{lines}"
+                results[name] = await run_phase(
+                    client, lambda: requests[name], args.duration, args.concurrency, counter, pool,
+                )
+            names, weights = zip(*args.mix.items())
+            results["mix"] = await run_phase(
+                client,
+                lambda: requests[random.choices(names, weights)[0]],
+                args.duration,
+                args.concurrency,
+                counter,
+                pool,
+            )
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "target": args.base_url or "in-process",
+            "users": args.users,
+            "products": args.products,
+            "receipts": args.receipts,
+            "lines": args.lines,
+            "line_sweep": args.line_sweep,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": args.mix,
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--products", type=int, default=2_000)
+    parser.add_argument("--receipts", type=int, default=10_000)
+    parser.add_argument("--lines", type=int, default=10, help="Line items per generated receipt")
+    parser.add_argument(
+        "--line-sweep", type=int, nargs="*", default=[1, 10, 100, 1000],
+        help="Line counts to run the create scenario with, none to skip the sweep",
+    )
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--deep-offset", type=int, help="Offset of the deep page, each user's last page by default")
+    parser.add_argument("--seed-batch-size", type=int, default=500)
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scenarios", nargs="*", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("auth=1,create=3,list=4,public=2"))
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args(argv)
+    if max(args.line_sweep, default=0) > args.products:
+        parser.error("--products must be at least the largest --line-sweep count, receipts don't repeat a product")
+    return args
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    random.seed(arguments.seed)
+    report = asyncio.run(main(arguments))
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    print(output)
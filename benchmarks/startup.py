@@ -0,0 +1,98 @@
+"""Cold start and throughput scaling of the production server.
+
+Starts `server.py` with each worker count in turn, measures the time until
+/internal/health answers, then drives --path for --duration seconds.
+Run `python -m database.migrations` first.
+
+    python -m benchmarks.startup --workers 1 2 4 --output startup.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.run import run_phase
+from benchmarks.stats import git_revision
+
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float) -> float:
+    started_at = time.perf_counter()
+    while time.perf_counter() - started_at < timeout:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if (await client.get("/internal/health")).status_code == 200:
+                return time.perf_counter() - started_at
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.05)
+    raise TimeoutError(f"Server did not start within {timeout} seconds")
+
+
+async def measure(args, workers: int) -> dict:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "PORT": str(args.port),
+        "MIGRATE_ON_STARTUP": "false",
+        "LOG_LEVEL": "WARNING",
+    }
+    server = subprocess.Popen([sys.executable, "server.py"], env=env)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=60) as client:
+            startup_seconds = await wait_until_ready(client, server, args.startup_timeout)
+
+            async def request(client):
+                return await client.get(args.path)
+
+            result = await run_phase(client, lambda: request, args.duration, args.concurrency * workers, None, None)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"workers": workers, "startup_seconds": startup_seconds, **result}
+
+
+async def main(args) -> dict:
+    results = [await measure(args, workers) for workers in args.workers]
+    baseline = results[0]["throughput_rps"] / results[0]["workers"]
+    for result in results:
+        result["scaling_efficiency"] = result["throughput_rps"] / (baseline * result["workers"]) if baseline else 0.0
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "cpu_count": os.cpu_count(),
+            "path": args.path,
+            "duration": args.duration,
+            "concurrency_per_worker": args.concurrency,
+        },
+        "scenarios": {f"workers_{result['workers']}": result for result in results},
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--path", default="/internal/health", help="Endpoint to drive after startup")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients per worker")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    print(output)
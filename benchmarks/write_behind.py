@@ -0,0 +1,85 @@
+"""POST /receipt/ with synchronous commits versus the write-behind log.
+
+Request latency is measured as seen by clients. Sustained throughput also
+counts the time the write-behind consumer needs to commit everything that was
+acknowledged during the run.
+
+    python -m benchmarks.write_behind --duration 20 --output write_behind.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.run import build_requests, login, run_phase, seed
+from benchmarks.stats import git_revision
+
+
+async def main(args) -> dict:
+    import main as application
+    from services import ReceiptService
+    from services.write_behind import ReceiptWriteBehind
+
+    results = {}
+    async with application.app.router.lifespan_context(application.app):
+        context = await seed(args)
+        transport = httpx.ASGITransport(app=application.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            tokens = {name: await login(client, name, args.password) for name in context["logins"]}
+            create = build_requests(args, context, tokens)["create"]
+
+            for mode in ("sync", "write_behind"):
+                with tempfile.TemporaryDirectory() as directory:
+                    if mode == "write_behind":
+                        await ReceiptService.start_write_behind(ReceiptWriteBehind(directory=directory))
+                    result = await run_phase(client, lambda: create, args.duration, args.concurrency, None, None)
+                    elapsed = result["requests"] / result["throughput_rps"] if result["throughput_rps"] else 0.0
+                    started_at = time.perf_counter()
+                    await ReceiptService.stop_write_behind()
+                    drain = time.perf_counter() - started_at if mode == "write_behind" else 0.0
+                    result["drain_seconds"] = drain
+                    result["sustained_rps"] = result["requests"] / (elapsed + drain) if elapsed + drain else 0.0
+                    results[mode] = result
+
+    return {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "lines": args.lines,
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--products", type=int, default=2_000)
+    parser.add_argument("--receipts", type=int, default=0, help="Receipts seeded before the run")
+    parser.add_argument("--lines", type=int, default=10, help="Line items per generated receipt")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--seed-batch-size", type=int, default=500)
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per mode")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    random.seed(arguments.seed)
+    report = asyncio.run(main(arguments))
+    output = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            file.write(output)
+    print(output)
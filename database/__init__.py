@@ -1,2 +1,8 @@
-from .config import get_session, init_db
-from .models import User, Product, Receipt, ReceiptProductAssociation
+from .config import get_pool_metrics, get_replica_pool_metrics, init_db, close_db
+from .instrumentation import QueryStats, QueryTotals, collect_query_stats
+from .replicas import ReadConsistency, get_read_consistency, track_read_consistency
+from .unit_of_work import (
+    UnitOfWork, unit_of_work, get_unit_of_work, get_current_unit_of_work, get_session, get_read_session, mark_written,
+    has_replicas, after_commit, release_connection,
+)
+from .models import User, Product, Receipt, ReceiptProductAssociation, ReceiptIdempotencyKey, ReceiptDailyStats
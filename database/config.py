@@ -1,9 +1,14 @@
-from contextlib import asynccontextmanager
-
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
+import logging
 import os
 
+from database.instrumentation import instrument_engine
+from database.pool import InstrumentedAsyncPool
+from database.replicas import ReplicaSelection, ReplicaSet
+
+logger = logging.getLogger(__name__)
+
 
 SQLALCHEMY_DATABASE_URL = "postgresql+asyncpg://{user}:{password}@{hostname}/{database_name}".format(
     user=os.environ.get("POSTGRES_USER", "user"),
@@ -11,26 +16,81 @@ SQLALCHEMY_DATABASE_URL = "postgresql+asyncpg://{user}:{password}@{hostname}/{da
     hostname=os.environ.get("DB_HOST", "host"),
     database_name=os.environ.get("POSTGRES_DB", "db")
 )
+# Comma separated hosts of streaming replicas sharing the primary's credentials and database.
+SQLALCHEMY_REPLICA_URLS = [
+    "postgresql+asyncpg://{user}:{password}@{hostname}/{database_name}".format(
+        user=os.environ.get("POSTGRES_USER", "user"),
+        password=os.environ.get("POSTGRES_PASSWORD", "password"),
+        hostname=hostname.strip(),
+        database_name=os.environ.get("POSTGRES_DB", "db")
+    )
+    for hostname in os.environ.get("DB_REPLICA_HOSTS", "").split(",")
+    if hostname.strip()
+]
+
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY") or 1)
+# Connection budget for the whole deployment, split evenly between worker processes.
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", 0))
+if DB_MAX_CONNECTIONS:
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", max(DB_MAX_CONNECTIONS // WEB_CONCURRENCY, 1)))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 0))
+else:
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 30 * 60))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30_000))
+# Set both caches to 0 when running behind pgbouncer in transaction pooling mode.
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_PREPARED_STATEMENT_CACHE_SIZE", 100))
+
 
-print(SQLALCHEMY_DATABASE_URL)
+def _create_engine(url: str) -> AsyncEngine:
+    created = create_async_engine(
+        url,
+        poolclass=InstrumentedAsyncPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={
+            "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+            "prepared_statement_cache_size": DB_PREPARED_STATEMENT_CACHE_SIZE,
+            "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+        },
+    )
+    instrument_engine(created.sync_engine)
+    return created
 
 
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL,
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+replicas = ReplicaSet(
+    [_create_engine(url) for url in SQLALCHEMY_REPLICA_URLS],
+    ReplicaSelection(os.environ.get("DB_REPLICA_SELECTION", ReplicaSelection.ROUND_ROBIN.value)),
 )
 
 Base = declarative_base()
 
 
-@asynccontextmanager
-async def get_session() -> AsyncSession:
-    session = AsyncSession(engine)
-    try:
-        yield session
-    finally:
-        await session.close()
+def get_pool_metrics() -> dict:
+    return engine.pool.metrics()
+
+
+def get_replica_pool_metrics() -> list:
+    return replicas.metrics()
 
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    from database.migrations import run_migrations
+    from database.partitions import ensure_future_partitions
+
+    logger.info("Database: %s", engine.url.render_as_string(hide_password=True))
+    await run_migrations(engine)
+    await ensure_future_partitions(engine)
+
+
+async def close_db():
+    await engine.dispose()
+    await replicas.dispose()
@@ -0,0 +1,79 @@
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQL_SLOWEST_STATEMENTS = int(os.environ.get("SQL_SLOWEST_STATEMENTS", 3))
+# A request running the same statement this many times is reported as a likely N+1 pattern.
+SQL_REPEATED_STATEMENT_THRESHOLD = int(os.environ.get("SQL_REPEATED_STATEMENT_THRESHOLD", 5))
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slowest: List[Tuple[float, str]] = []
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+        if len(self.slowest) < SQL_SLOWEST_STATEMENTS or duration > self.slowest[-1][0]:
+            self.slowest.append((duration, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SQL_SLOWEST_STATEMENTS:]
+
+    def repeated(self) -> List[Tuple[str, int]]:
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= SQL_REPEATED_STATEMENT_THRESHOLD
+        ]
+
+
+class QueryTotals:
+    count = 0
+    duration = 0.0
+
+
+_current_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("current_query_stats", default=None)
+
+
+@contextmanager
+def collect_query_stats() -> Iterator[QueryStats]:
+    stats = QueryStats()
+    token = _current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_query_stats.reset(token)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_started_at"].pop()
+    QueryTotals.count += 1
+    QueryTotals.duration += duration
+    stats = _current_query_stats.get()
+    if stats is not None:
+        stats.record(statement, duration)
+
+
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_started_at"):
+        context.connection.info["query_started_at"].pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
@@ -0,0 +1,16 @@
+import asyncio
+
+from database.config import engine
+from database.migrations import run_migrations
+from database.partitions import ensure_future_partitions
+
+
+async def main():
+    applied = await run_migrations(engine)
+    print(f"Applied migrations: {', '.join(applied) or 'none'}")
+    await ensure_future_partitions(engine)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
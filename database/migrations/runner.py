@@ -0,0 +1,49 @@
+import importlib
+import pkgutil
+from types import ModuleType
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from database.migrations import versions
+
+# Arbitrary application-wide key, serializes concurrent migration runs.
+MIGRATIONS_LOCK_ID = 814_307_221
+
+
+def get_migrations() -> List[ModuleType]:
+    modules = [
+        importlib.import_module(f"{versions.__name__}.{info.name}")
+        for info in pkgutil.iter_modules(versions.__path__)
+    ]
+    return sorted(modules, key=lambda module: module.revision)
+
+
+async def execute_all(connection: AsyncConnection, statements: List[str]) -> None:
+    for statement in statements:
+        await connection.execute(text(statement))
+
+
+async def run_migrations(engine: AsyncEngine) -> List[str]:
+    async with engine.begin() as connection:
+        await connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATIONS_LOCK_ID})
+        await connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "revision VARCHAR PRIMARY KEY, "
+            "description VARCHAR NOT NULL, "
+            "applied_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL)"
+        ))
+        applied = set((await connection.execute(text("SELECT revision FROM schema_migrations"))).scalars().all())
+
+        newly_applied = []
+        for migration in get_migrations():
+            if migration.revision in applied:
+                continue
+            await migration.upgrade(connection)
+            await connection.execute(
+                text("INSERT INTO schema_migrations (revision, description) VALUES (:revision, :description)"),
+                {"revision": migration.revision, "description": migration.description},
+            )
+            newly_applied.append(migration.revision)
+    return newly_applied
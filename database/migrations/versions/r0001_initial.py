@@ -0,0 +1,70 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.migrations.runner import execute_all
+
+revision = "0001"
+description = "Initial schema"
+
+
+async def upgrade(connection: AsyncConnection) -> None:
+    # IF NOT EXISTS lets databases created earlier by metadata.create_all adopt the migrations.
+    await execute_all(connection, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            modified_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            name VARCHAR NOT NULL,
+            login VARCHAR,
+            hashed_password VARCHAR NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_login ON users (login)",
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            id SERIAL NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            modified_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            name VARCHAR NOT NULL,
+            price FLOAT NOT NULL,
+            PRIMARY KEY (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_products_id ON products (id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_products_name ON products (name)",
+        """
+        CREATE TABLE IF NOT EXISTS receipts (
+            id SERIAL NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            modified_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            user_id INTEGER NOT NULL,
+            total FLOAT NOT NULL,
+            amount_paid FLOAT NOT NULL,
+            payment_type VARCHAR NOT NULL,
+            rest FLOAT NOT NULL,
+            public_token VARCHAR,
+            PRIMARY KEY (id),
+            FOREIGN KEY(user_id) REFERENCES users (id),
+            UNIQUE (public_token)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_receipts_id ON receipts (id)",
+        """
+        CREATE TABLE IF NOT EXISTS receipt_products (
+            id SERIAL NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            modified_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            receipt_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER,
+            total FLOAT NOT NULL,
+            weight FLOAT,
+            PRIMARY KEY (id),
+            FOREIGN KEY(receipt_id) REFERENCES receipts (id),
+            FOREIGN KEY(product_id) REFERENCES products (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_receipt_products_id ON receipt_products (id)",
+    ])
@@ -0,0 +1,24 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.migrations.runner import execute_all
+
+revision = "0002"
+description = "Idempotency keys for batch receipt ingestion"
+
+
+async def upgrade(connection: AsyncConnection) -> None:
+    await execute_all(connection, [
+        "ALTER TABLE receipts ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR",
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'uq_receipts_user_id_idempotency_key'
+            ) THEN
+                ALTER TABLE receipts
+                    ADD CONSTRAINT uq_receipts_user_id_idempotency_key UNIQUE (user_id, idempotency_key);
+            END IF;
+        END
+        $$
+        """,
+    ])
@@ -0,0 +1,17 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.migrations.runner import execute_all
+
+revision = "0003"
+description = "Indexes backing the receipt filters"
+
+
+async def upgrade(connection: AsyncConnection) -> None:
+    await execute_all(connection, [
+        "CREATE INDEX IF NOT EXISTS ix_receipts_user_id_id ON receipts (user_id, id)",
+        "CREATE INDEX IF NOT EXISTS ix_receipts_user_id_created_at_id ON receipts (user_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_receipts_user_id_payment_type_id ON receipts (user_id, payment_type, id)",
+        "CREATE INDEX IF NOT EXISTS ix_receipts_user_id_total ON receipts (user_id, total)",
+        "CREATE INDEX IF NOT EXISTS ix_receipt_products_receipt_id ON receipt_products (receipt_id)",
+        "CREATE INDEX IF NOT EXISTS ix_receipt_products_product_id ON receipt_products (product_id)",
+    ])
@@ -0,0 +1,29 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.migrations.runner import execute_all
+
+revision = "0004"
+description = "Daily receipt rollup for the stats endpoint"
+
+
+async def upgrade(connection: AsyncConnection) -> None:
+    await execute_all(connection, [
+        """
+        CREATE TABLE IF NOT EXISTS receipt_daily_stats (
+            user_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            payment_type VARCHAR NOT NULL,
+            receipts_count INTEGER NOT NULL,
+            total FLOAT NOT NULL,
+            PRIMARY KEY (user_id, day, payment_type),
+            FOREIGN KEY(user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        INSERT INTO receipt_daily_stats (user_id, day, payment_type, receipts_count, total)
+        SELECT user_id, (created_at AT TIME ZONE 'UTC')::date, payment_type, count(*), sum(total)
+        FROM receipts
+        GROUP BY 1, 2, 3
+        ON CONFLICT DO NOTHING
+        """,
+    ])
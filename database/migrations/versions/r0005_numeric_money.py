@@ -0,0 +1,32 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.migrations.runner import execute_all
+
+revision = "0005"
+description = "Fixed-point money columns"
+
+
+async def upgrade(connection: AsyncConnection) -> None:
+    await execute_all(connection, [
+        "ALTER TABLE products ALTER COLUMN price TYPE NUMERIC(12, 2) USING round(price::numeric, 2)",
+        """
+        ALTER TABLE receipts
+            ALTER COLUMN total TYPE NUMERIC(12, 2) USING round(total::numeric, 2),
+            ALTER COLUMN amount_paid TYPE NUMERIC(12, 2) USING round(amount_paid::numeric, 2),
+            ALTER COLUMN rest TYPE NUMERIC(12, 2) USING round(rest::numeric, 2)
+        """,
+        """
+        ALTER TABLE receipt_products
+            ALTER COLUMN total TYPE NUMERIC(12, 2) USING round(total::numeric, 2),
+            ALTER COLUMN weight TYPE NUMERIC(10, 3) USING round(weight::numeric, 3)
+        """,
+        "ALTER TABLE receipt_daily_stats ALTER COLUMN total TYPE NUMERIC(14, 2)",
+        # Rebuild the rollup from the rounded receipt totals so both stay exactly in sync.
+        "TRUNCATE receipt_daily_stats",
+        """
+        INSERT INTO receipt_daily_stats (user_id, day, payment_type, receipts_count, total)
+        SELECT user_id, (created_at AT TIME ZONE 'UTC')::date, payment_type, count(*), sum(total)
+        FROM receipts
+        GROUP BY 1, 2, 3
+        """,
+    ])
@@ -0,0 +1,120 @@
+from datetime import timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.migrations.runner import execute_all
+from database.partitions import PARTITION_MONTHS_AHEAD, add_months, create_partitions, month_start
+
+revision = "0006"
+description = "Monthly range partitions for receipts and receipt_products"
+
+
+async def upgrade(connection: AsyncConnection) -> None:
+    # Unique constraints on partitioned tables must include the partition key, so the primary keys become
+    # (id, created_at), line items carry their receipt's created_at and idempotency keys move to their own table.
+    await execute_all(connection, [
+        "ALTER TABLE receipt_products RENAME TO receipt_products_legacy",
+        "ALTER TABLE receipts RENAME TO receipts_legacy",
+        "ALTER TABLE receipt_products_legacy DROP CONSTRAINT IF EXISTS receipt_products_receipt_id_fkey",
+        "ALTER TABLE receipt_products_legacy DROP CONSTRAINT IF EXISTS receipt_products_product_id_fkey",
+        "ALTER TABLE receipt_products_legacy DROP CONSTRAINT IF EXISTS receipt_products_pkey",
+        "ALTER TABLE receipts_legacy DROP CONSTRAINT IF EXISTS receipts_user_id_fkey",
+        "ALTER TABLE receipts_legacy DROP CONSTRAINT IF EXISTS receipts_public_token_key",
+        "ALTER TABLE receipts_legacy DROP CONSTRAINT IF EXISTS uq_receipts_user_id_idempotency_key",
+        "ALTER TABLE receipts_legacy DROP CONSTRAINT IF EXISTS receipts_pkey",
+        "DROP INDEX IF EXISTS ix_receipts_id",
+        "DROP INDEX IF EXISTS ix_receipts_user_id_id",
+        "DROP INDEX IF EXISTS ix_receipts_user_id_created_at_id",
+        "DROP INDEX IF EXISTS ix_receipts_user_id_payment_type_id",
+        "DROP INDEX IF EXISTS ix_receipts_user_id_total",
+        "DROP INDEX IF EXISTS ix_receipt_products_id",
+        "DROP INDEX IF EXISTS ix_receipt_products_receipt_id",
+        "DROP INDEX IF EXISTS ix_receipt_products_product_id",
+        "ALTER SEQUENCE receipts_id_seq OWNED BY NONE",
+        "ALTER SEQUENCE receipt_products_id_seq OWNED BY NONE",
+        """
+        CREATE TABLE receipts (
+            id INTEGER DEFAULT nextval('receipts_id_seq') NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            modified_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            user_id INTEGER NOT NULL,
+            total NUMERIC(12, 2) NOT NULL,
+            amount_paid NUMERIC(12, 2) NOT NULL,
+            payment_type VARCHAR NOT NULL,
+            rest NUMERIC(12, 2) NOT NULL,
+            public_token VARCHAR,
+            idempotency_key VARCHAR,
+            PRIMARY KEY (id, created_at),
+            FOREIGN KEY(user_id) REFERENCES users (id)
+        ) PARTITION BY RANGE (created_at)
+        """,
+        "CREATE INDEX ix_receipts_user_id_id ON receipts (user_id, id)",
+        "CREATE INDEX ix_receipts_user_id_created_at_id ON receipts (user_id, created_at, id)",
+        "CREATE INDEX ix_receipts_user_id_payment_type_id ON receipts (user_id, payment_type, id)",
+        "CREATE INDEX ix_receipts_user_id_total ON receipts (user_id, total)",
+        "CREATE INDEX ix_receipts_public_token ON receipts (public_token)",
+        """
+        CREATE TABLE receipt_products (
+            id INTEGER DEFAULT nextval('receipt_products_id_seq') NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            modified_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            receipt_id INTEGER NOT NULL,
+            receipt_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER,
+            total NUMERIC(12, 2) NOT NULL,
+            weight NUMERIC(10, 3),
+            PRIMARY KEY (id, receipt_created_at),
+            FOREIGN KEY(receipt_id, receipt_created_at) REFERENCES receipts (id, created_at),
+            FOREIGN KEY(product_id) REFERENCES products (id)
+        ) PARTITION BY RANGE (receipt_created_at)
+        """,
+        "CREATE INDEX ix_receipt_products_receipt_id ON receipt_products (receipt_id)",
+        "CREATE INDEX ix_receipt_products_product_id ON receipt_products (product_id)",
+        "ALTER SEQUENCE receipts_id_seq OWNED BY receipts.id",
+        "ALTER SEQUENCE receipt_products_id_seq OWNED BY receipt_products.id",
+        """
+        CREATE TABLE receipt_idempotency_keys (
+            user_id INTEGER NOT NULL,
+            idempotency_key VARCHAR NOT NULL,
+            receipt_id INTEGER NOT NULL,
+            receipt_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (user_id, idempotency_key),
+            FOREIGN KEY(user_id) REFERENCES users (id)
+        )
+        """,
+        "CREATE INDEX ix_receipt_idempotency_keys_receipt_created_at ON receipt_idempotency_keys (receipt_created_at)",
+    ])
+
+    first_created_at = (await connection.execute(text("SELECT min(created_at) FROM receipts_legacy"))).scalar()
+    current_month = month_start((await connection.execute(text("SELECT (now() AT TIME ZONE 'UTC')::date"))).scalar())
+    first_month = month_start(first_created_at.astimezone(timezone.utc).date()) if first_created_at else current_month
+    await create_partitions(connection, first_month, add_months(current_month, PARTITION_MONTHS_AHEAD))
+
+    await execute_all(connection, [
+        """
+        INSERT INTO receipts (
+            id, created_at, modified_at, user_id, total, amount_paid, payment_type, rest, public_token, idempotency_key
+        )
+        SELECT id, created_at, modified_at, user_id, total, amount_paid, payment_type, rest, public_token, idempotency_key
+        FROM receipts_legacy
+        """,
+        """
+        INSERT INTO receipt_products (
+            id, created_at, modified_at, receipt_id, receipt_created_at, product_id, quantity, total, weight
+        )
+        SELECT line.id, line.created_at, line.modified_at, line.receipt_id, receipt.created_at,
+               line.product_id, line.quantity, line.total, line.weight
+        FROM receipt_products_legacy line
+        JOIN receipts_legacy receipt ON receipt.id = line.receipt_id
+        """,
+        """
+        INSERT INTO receipt_idempotency_keys (user_id, idempotency_key, receipt_id, receipt_created_at)
+        SELECT user_id, idempotency_key, id, created_at
+        FROM receipts_legacy
+        WHERE idempotency_key IS NOT NULL
+        """,
+        "DROP TABLE receipt_products_legacy",
+        "DROP TABLE receipts_legacy",
+    ])
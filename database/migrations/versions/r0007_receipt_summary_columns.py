@@ -0,0 +1,37 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.migrations.runner import execute_all
+from database.models import PRODUCT_NAMES_PREVIEW_SIZE
+
+revision = "0007"
+description = "Receipt item count and product name preview for summary lists"
+
+
+async def upgrade(connection: AsyncConnection) -> None:
+    await execute_all(connection, [
+        """
+        ALTER TABLE receipts
+            ADD COLUMN item_count INTEGER DEFAULT 0 NOT NULL,
+            ADD COLUMN product_names VARCHAR[]
+        """,
+        f"""
+        UPDATE receipts
+        SET item_count = summary.item_count, product_names = summary.product_names
+        FROM (
+            SELECT
+                receipt_products.receipt_id,
+                receipt_products.receipt_created_at,
+                count(*) AS item_count,
+                (array_agg(products.name ORDER BY receipt_products.id))[1:{PRODUCT_NAMES_PREVIEW_SIZE}] AS product_names
+            FROM receipt_products
+            JOIN products ON products.id = receipt_products.product_id
+            GROUP BY 1, 2
+        ) AS summary
+        WHERE receipts.id = summary.receipt_id AND receipts.created_at = summary.receipt_created_at
+        """,
+        "DROP INDEX IF EXISTS ix_receipts_user_id_id",
+        """
+        CREATE INDEX ix_receipts_user_id_id ON receipts (user_id, id)
+            INCLUDE (created_at, total, payment_type, item_count)
+        """,
+    ])
@@ -1,10 +1,16 @@
 import uuid
 
-from sqlalchemy import Column, Float, Integer, String, DateTime, func, ForeignKey
+from sqlalchemy import (
+    Column, Date, Numeric, Integer, String, DateTime, func, ForeignKey, ForeignKeyConstraint, Index, Sequence,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 
 from database.config import Base
 
+# Number of product names kept on each receipt for list previews.
+PRODUCT_NAMES_PREVIEW_SIZE = 3
+
 
 class MixinBase(Base):
     __abstract__ = True
@@ -26,13 +32,19 @@ class User(MixinBase):
 
 class ReceiptProductAssociation(MixinBase):
     __tablename__ = "receipt_products"
-
-    id = Column(Integer, primary_key=True, index=True)
-    receipt_id = Column(Integer, ForeignKey("receipts.id"), nullable=False)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    __table_args__ = (
+        ForeignKeyConstraint(["receipt_id", "receipt_created_at"], ["receipts.id", "receipts.created_at"]),
+        {"postgresql_partition_by": "RANGE (receipt_created_at)"},
+    )
+
+    id = Column(Integer, Sequence("receipt_products_id_seq"), primary_key=True)
+    receipt_id = Column(Integer, nullable=False, index=True)
+    # Copy of the receipt's partition key, so line items live in the same monthly partition as their receipt.
+    receipt_created_at = Column(DateTime(timezone=True), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     quantity = Column(Integer, nullable=True, default=1)
-    total = Column(Float, nullable=False)
-    weight = Column(Float, nullable=True)
+    total = Column(Numeric(12, 2), nullable=False)
+    weight = Column(Numeric(10, 3), nullable=True)
 
     receipt = relationship("Receipt", back_populates="products")
     product = relationship("Product")
@@ -40,20 +52,62 @@ class ReceiptProductAssociation(MixinBase):
 
 class Product(MixinBase):
     __tablename__ = "products"
+    __table_args__ = (
+        # Serves substring, similarity and prefix matches of receipt search and autocomplete.
+        Index("ix_products_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
 
     name = Column(String, nullable=False, unique=True, index=True)
-    price = Column(Float, nullable=False)
+    price = Column(Numeric(12, 2), nullable=False)
 
 
 class Receipt(MixinBase):
     __tablename__ = "receipts"
-
+    __table_args__ = (
+        # Covers the default summary fields, so summary pages are read with index-only scans.
+        Index(
+            "ix_receipts_user_id_id", "user_id", "id",
+            postgresql_include=["created_at", "total", "payment_type", "item_count"],
+        ),
+        Index("ix_receipts_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index("ix_receipts_user_id_payment_type_id", "user_id", "payment_type", "id"),
+        Index("ix_receipts_user_id_total", "user_id", "total"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    id = Column(Integer, Sequence("receipts_id_seq"), primary_key=True)
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now(), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    total = Column(Float, nullable=False)
-    amount_paid = Column(Float, nullable=False)
+    total = Column(Numeric(12, 2), nullable=False)
+    amount_paid = Column(Numeric(12, 2), nullable=False)
     payment_type = Column(String, nullable=False)
-    rest = Column(Float, nullable=False)
-    public_token = Column(String, unique=True, default=lambda: str(uuid.uuid4()))
+    rest = Column(Numeric(12, 2), nullable=False)
+    # Unique constraints on a partitioned table must include created_at, so uniqueness of the token
+    # relies on uuid4 and that of idempotency keys on ReceiptIdempotencyKey.
+    public_token = Column(String, index=True, default=lambda: str(uuid.uuid4()))
+    idempotency_key = Column(String, nullable=True)
+    # Denormalized from the line items when the receipt is saved.
+    item_count = Column(Integer, nullable=False, server_default="0")
+    product_names = Column(ARRAY(String), nullable=True)
 
     user = relationship("User", back_populates="receipts")
-    products = relationship("ReceiptProductAssociation")
+    products = relationship("ReceiptProductAssociation", back_populates="receipt")
+
+
+class ReceiptIdempotencyKey(Base):
+    __tablename__ = "receipt_idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    idempotency_key = Column(String, primary_key=True)
+    receipt_id = Column(Integer, nullable=False)
+    receipt_created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class ReceiptDailyStats(Base):
+    __tablename__ = "receipt_daily_stats"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    receipts_count = Column(Integer, nullable=False)
+    total = Column(Numeric(14, 2), nullable=False)
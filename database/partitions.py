@@ -0,0 +1,192 @@
+"""Monthly partitions of receipts and receipt_products.
+
+    python -m database.partitions maintain
+    python -m database.partitions archive --older-than-months 12 --directory archive
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+PARTITION_MONTHS_AHEAD = int(os.environ.get("PARTITION_MONTHS_AHEAD", 3))
+PARTITION_ARCHIVE_DIRECTORY = os.environ.get("PARTITION_ARCHIVE_DIRECTORY", "archive")
+# Seconds between runs of the partition maintenance in app processes, 0 disables it.
+PARTITION_MAINTENANCE_INTERVAL = float(os.environ.get("PARTITION_MAINTENANCE_INTERVAL", 24 * 60 * 60))
+# Line items are detached before the receipts they reference.
+PARTITIONED_TABLES = ("receipt_products", "receipts")
+EXPORT_BATCH_SIZE = 10_000
+# Arbitrary application-wide key, serializes concurrent partition maintenance.
+PARTITIONS_LOCK_ID = 814_307_222
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def _bound(month: date) -> str:
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+async def create_partitions(connection: AsyncConnection, first_month: date, last_month: date) -> List[str]:
+    created = []
+    month = month_start(first_month)
+    while month <= last_month:
+        for table in reversed(PARTITIONED_TABLES):
+            name = partition_name(table, month)
+            await connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+            ))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+async def get_partition_months(connection: AsyncConnection, table: str) -> List[date]:
+    names = (await connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": table})).scalars().all()
+    months = []
+    for name in names:
+        match = re.fullmatch(rf"{table}_(\d{{4}})_(\d{{2}})", name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+async def ensure_future_partitions(engine: AsyncEngine, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    current_month = month_start(datetime.now(timezone.utc).date())
+    async with engine.begin() as connection:
+        # Concurrent CREATE TABLE IF NOT EXISTS of the same partition fails instead of waiting.
+        await connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": PARTITIONS_LOCK_ID})
+        return await create_partitions(connection, current_month, add_months(current_month, months_ahead))
+
+
+async def check_partitions(engine: AsyncEngine, months_ahead: int = 1) -> None:
+    # There is no DEFAULT partition: it would have to be emptied before the month of its rows could get a partition.
+    # A receipt for a month without a partition fails instead, so processes refuse to start without them.
+    current_month = month_start(datetime.now(timezone.utc).date())
+    required = [add_months(current_month, months) for months in range(months_ahead + 1)]
+    missing = []
+    async with engine.connect() as connection:
+        for table in PARTITIONED_TABLES:
+            months = set(await get_partition_months(connection, table))
+            missing.extend(partition_name(table, month) for month in required if month not in months)
+    if missing:
+        raise RuntimeError(
+            f"Partitions {', '.join(missing)} are missing, create them with `python -m database.partitions maintain`"
+        )
+
+
+async def start_partition_maintenance(
+        engine: AsyncEngine,
+        interval: float = PARTITION_MAINTENANCE_INTERVAL,
+) -> Optional[asyncio.Task]:
+    # Partitions are created by the migrations or `python -m database.partitions maintain`, workers only check them
+    # at startup so that schema changes keep running once per deploy.
+    await check_partitions(engine)
+    return asyncio.create_task(maintain_partitions_forever(engine, interval)) if interval else None
+
+
+async def maintain_partitions_forever(engine: AsyncEngine, interval: float = PARTITION_MAINTENANCE_INTERVAL) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await ensure_future_partitions(engine)
+        except Exception:
+            logger.exception("Creating future partitions failed")
+
+
+async def _export_partition(connection: AsyncConnection, name: str, path: str) -> int:
+    rows = 0
+    result = await connection.stream(
+        text(f"SELECT * FROM {name}").execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    with gzip.open(path + ".tmp", "wb") as file:
+        async for row in result:
+            file.write(json.dumps(dict(row._mapping), default=str).encode() + b"\n")
+            rows += 1
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".tmp", path)
+    return rows
+
+
+async def archive_partitions(engine: AsyncEngine, older_than: date, directory: str) -> List[str]:
+    # Exports each month before `older_than` to gzip NDJSON, then detaches and drops its partitions.
+    os.makedirs(directory, exist_ok=True)
+    async with engine.connect() as connection:
+        months = [month for month in await get_partition_months(connection, "receipts") if month < older_than]
+
+    archived = []
+    for month in months:
+        async with engine.begin() as connection:
+            for table in PARTITIONED_TABLES:
+                name = partition_name(table, month)
+                path = os.path.join(directory, f"{name}.ndjson.gz")
+                rows = await _export_partition(connection, name, path)
+                logger.info("Exported %d rows of %s to %s", rows, name, path)
+            for table in PARTITIONED_TABLES:
+                name = partition_name(table, month)
+                await connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                await connection.execute(text(f"DROP TABLE {name}"))
+            # Keys of archived receipts could otherwise point a retried request at a missing receipt.
+            await connection.execute(
+                text(
+                    "DELETE FROM receipt_idempotency_keys "
+                    "WHERE receipt_created_at >= :start AND receipt_created_at < :end"
+                ),
+                {
+                    "start": datetime.combine(month, datetime.min.time(), timezone.utc),
+                    "end": datetime.combine(add_months(month, 1), datetime.min.time(), timezone.utc),
+                },
+            )
+        archived.append(partition_name("receipts", month))
+    return archived
+
+
+async def main(args):
+    from database.config import engine
+
+    if args.command == "maintain":
+        created = await ensure_future_partitions(engine, args.months_ahead)
+        print(f"Ensured partitions: {', '.join(created)}")
+    else:
+        older_than = add_months(month_start(datetime.now(timezone.utc).date()), -args.older_than_months)
+        archived = await archive_partitions(engine, older_than, args.directory)
+        print(f"Archived partitions: {', '.join(archived) or 'none'}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    maintain = commands.add_parser("maintain", help="Create partitions for the coming months")
+    maintain.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    archive = commands.add_parser("archive", help="Export and drop old partitions")
+    archive.add_argument("--older-than-months", type=int, default=12)
+    archive.add_argument("--directory", default=PARTITION_ARCHIVE_DIRECTORY)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(parser.parse_args()))
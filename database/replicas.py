@@ -0,0 +1,92 @@
+import enum
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Hashable, Iterator, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# How long reads keyed to a recent write stay on the primary, covering replication lag.
+DB_REPLICA_READ_YOUR_WRITES_SECONDS = float(os.environ.get("DB_REPLICA_READ_YOUR_WRITES_SECONDS", 5))
+RECENT_WRITES_MAXSIZE = 100_000
+
+
+class ReadConsistency:
+    # Carried by the client between requests, as recent writes are only known to the worker that made them.
+    def __init__(self, last_write_at: Optional[float] = None):
+        self.last_write_at = last_write_at
+        self.wrote = False
+
+    def requires_primary(self) -> bool:
+        if self.last_write_at is None:
+            return False
+        # A timestamp from the future is forged or from a skewed clock, and never pins reads to the primary.
+        return 0 <= time.time() - self.last_write_at < DB_REPLICA_READ_YOUR_WRITES_SECONDS
+
+
+_current_read_consistency: ContextVar[Optional[ReadConsistency]] = ContextVar("read_consistency", default=None)
+
+
+def get_read_consistency() -> Optional[ReadConsistency]:
+    return _current_read_consistency.get()
+
+
+@contextmanager
+def track_read_consistency(last_write_at: Optional[float] = None) -> Iterator[ReadConsistency]:
+    consistency = ReadConsistency(last_write_at)
+    token = _current_read_consistency.set(consistency)
+    try:
+        yield consistency
+    finally:
+        _current_read_consistency.reset(token)
+
+
+class ReplicaSelection(str, enum.Enum):
+    ROUND_ROBIN = "round_robin"
+    LEAST_CONNECTIONS = "least_connections"
+
+
+class ReplicaSet:
+    def __init__(self, engines: List[AsyncEngine], selection: ReplicaSelection = ReplicaSelection.ROUND_ROBIN):
+        self.engines = engines
+        self.selection = selection
+        self._next = 0
+        self._recent_writes: Dict[Hashable, float] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def choose(self) -> AsyncEngine:
+        if self.selection == ReplicaSelection.LEAST_CONNECTIONS:
+            return min(self.engines, key=lambda engine: engine.pool.checkedout())
+        engine = self.engines[self._next % len(self.engines)]
+        self._next += 1
+        return engine
+
+    def remember_write(self, key: Hashable) -> None:
+        now = time.monotonic()
+        if len(self._recent_writes) >= RECENT_WRITES_MAXSIZE:
+            self._recent_writes = {k: until for k, until in self._recent_writes.items() if until > now}
+        self._recent_writes[key] = now + DB_REPLICA_READ_YOUR_WRITES_SECONDS
+
+    def recently_written(self, key: Optional[Hashable]) -> bool:
+        if key is None:
+            return False
+        until = self._recent_writes.get(key)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            self._recent_writes.pop(key, None)
+            return False
+        return True
+
+    def metrics(self) -> list:
+        return [
+            {"url": engine.url.render_as_string(hide_password=True), **engine.pool.metrics()}
+            for engine in self.engines
+        ]
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
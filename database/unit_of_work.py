@@ -0,0 +1,134 @@
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Hashable, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.config import engine, replicas
+from database.replicas import get_read_consistency
+
+logger = logging.getLogger(__name__)
+
+
+class UnitOfWork:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.written = False
+        self.after_commit: List[Callable[[], Awaitable[None]]] = []
+
+    @asynccontextmanager
+    async def savepoint(self) -> AsyncIterator[AsyncSession]:
+        async with self.session.begin_nested():
+            yield self.session
+
+    async def commit(self) -> None:
+        await self.session.commit()
+        callbacks, self.after_commit = self.after_commit, []
+        for callback in callbacks:
+            try:
+                await callback()
+            except Exception:
+                # The data is committed already, so a failed side effect must not fail the request.
+                logger.exception("After-commit callback failed")
+
+    async def rollback(self) -> None:
+        await self.session.rollback()
+        self.after_commit = []
+
+
+_current_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("unit_of_work", default=None)
+
+
+def get_current_unit_of_work() -> Optional[UnitOfWork]:
+    return _current_unit_of_work.get()
+
+
+@asynccontextmanager
+async def unit_of_work() -> AsyncIterator[UnitOfWork]:
+    current = _current_unit_of_work.get()
+    if current is not None:
+        yield current
+        return
+
+    async with AsyncSession(engine) as session:
+        uow = UnitOfWork(session)
+        token = _current_unit_of_work.set(uow)
+        try:
+            yield uow
+            await uow.commit()
+        finally:
+            _current_unit_of_work.reset(token)
+
+
+async def get_unit_of_work() -> AsyncIterator[UnitOfWork]:
+    async with unit_of_work() as uow:
+        yield uow
+
+
+@asynccontextmanager
+async def get_session() -> AsyncIterator[AsyncSession]:
+    current = _current_unit_of_work.get()
+    if current is not None:
+        yield current.session
+        return
+
+    async with AsyncSession(engine) as session:
+        yield session
+        await session.commit()
+
+
+# Ends the current unit of work's read-only transaction so its connection goes back to the pool during slow work
+# that needs no database, such as password hashing. The next query checks a connection out again.
+async def release_connection() -> None:
+    current = _current_unit_of_work.get()
+    if current is None:
+        return
+    if current.written:
+        raise RuntimeError("Can't release the connection of a unit of work with uncommitted writes")
+    await current.session.commit()
+
+
+# Runs `callback` once the current unit of work is committed, or right away outside of one.
+async def after_commit(callback: Callable[[], Awaitable[None]]) -> None:
+    current = _current_unit_of_work.get()
+    if current is not None:
+        current.after_commit.append(callback)
+    else:
+        await callback()
+
+
+# Keeps reads for `key`, and the rest of the current unit of work, on the primary.
+def mark_written(key: Optional[Hashable] = None) -> None:
+    current = _current_unit_of_work.get()
+    if current is not None:
+        current.written = True
+    consistency = get_read_consistency()
+    if consistency is not None:
+        consistency.wrote = True
+    if replicas and key is not None:
+        replicas.remember_write(key)
+
+
+def has_replicas() -> bool:
+    return bool(replicas)
+
+
+def _reads_from_primary(key: Optional[Hashable]) -> bool:
+    current = _current_unit_of_work.get()
+    if current is not None and current.written:
+        return True
+    consistency = get_read_consistency()
+    return (consistency is not None and consistency.requires_primary()) or replicas.recently_written(key)
+
+
+# Read-only queries go to a replica unless the data behind `key`, or anything the client wrote, was just written.
+@asynccontextmanager
+async def get_read_session(key: Optional[Hashable] = None) -> AsyncIterator[AsyncSession]:
+    if not replicas or _reads_from_primary(key):
+        async with get_session() as session:
+            yield session
+        return
+
+    async with AsyncSession(replicas.choose()) as session:
+        yield session
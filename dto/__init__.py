@@ -1,4 +1,11 @@
-from .user import User, UserCreate
+from .user import User, UserCreate, Principal
 from .product import Product, ProductAggregated
-from .receipt import ReceiptCreate, Receipt, Payment, PaymentType
-from .filters import ReceiptSwaggerFilters, PaginationFilters, CreatedAtFilters, ReceiptFilters
+from .receipt import (
+    ReceiptCreate, Receipt, Payment, PaymentType, ReceiptBatchItem, ReceiptBatchResult, ReceiptBatchStatus,
+    ReceiptExportFormat, ReceiptStatsGroupBy, ReceiptStats,
+    ReceiptRenderFormat, PendingReceipt, ReceiptField, ReceiptSummary, ReceiptSearchResult,
+)
+from .filters import (
+    ReceiptSwaggerFilters, PaginationFilters, CreatedAtFilters, ReceiptAttributeFilters, ReceiptFilters,
+    ReceiptCountMode,
+)
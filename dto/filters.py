@@ -1,14 +1,41 @@
+import base64
+import json
 from datetime import datetime
-from typing import Optional
+from decimal import Decimal
+from enum import Enum
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
-from dto import PaymentType
+from dto import PaymentType, ReceiptField
+
+# Returned for include_products=false; all of them are covered by ix_receipts_user_id_id.
+RECEIPT_SUMMARY_DEFAULT_FIELDS = (
+    ReceiptField.ID, ReceiptField.CREATED_AT, ReceiptField.TOTAL, ReceiptField.PAYMENT_TYPE, ReceiptField.ITEM_COUNT,
+)
 
 
 class PaginationFilters(BaseModel):
     limit: Optional[int] = Field(default=20, gt=0)
     offset: Optional[int] = Field(default=0, ge=0)
+    after: Optional[str] = None
+    before: Optional[str] = None
+
+    @classmethod
+    def encode_cursor(cls, receipt_id: int) -> str:
+        payload = json.dumps({"id": receipt_id}, separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+    @classmethod
+    def decode_cursor(cls, cursor: str) -> int:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            receipt_id = payload["id"]
+        except (ValueError, TypeError, KeyError):
+            raise ValueError("Cursor is invalid")
+        if not isinstance(receipt_id, int):
+            raise ValueError("Cursor is invalid")
+        return receipt_id
 
 
 class CreatedAtFilters(BaseModel):
@@ -16,10 +43,37 @@ class CreatedAtFilters(BaseModel):
     min_created_at: Optional[datetime] = None
 
 
-class ReceiptSwaggerFilters(PaginationFilters, CreatedAtFilters):
+class ReceiptAttributeFilters(CreatedAtFilters):
     payment_type: Optional[PaymentType] = None
-    min_total: Optional[float] = None
-    max_total: Optional[float] = None
+    min_total: Optional[Decimal] = None
+    max_total: Optional[Decimal] = None
+
+
+class ReceiptCountMode(str, Enum):
+    EXACT = "exact"
+    ESTIMATED = "estimated"
+
+
+class ReceiptSwaggerFilters(PaginationFilters, ReceiptAttributeFilters):
+    count_mode: Optional[ReceiptCountMode] = None
+    fields: Optional[str] = None
+    include_products: Optional[bool] = None
+
+    def get_summary_fields(self) -> Optional[List[ReceiptField]]:
+        # None means full receipts with their products; the id is always returned as pages are keyed by it.
+        if self.fields is None:
+            return None if self.include_products is not False else list(RECEIPT_SUMMARY_DEFAULT_FIELDS)
+        if self.include_products:
+            raise ValueError("'fields' can't be combined with include_products=true")
+        fields = [ReceiptField.ID]
+        for name in self.fields.split(","):
+            try:
+                field = ReceiptField(name.strip())
+            except ValueError:
+                raise ValueError(f"Unknown field '{name.strip()}'")
+            if field not in fields:
+                fields.append(field)
+        return fields
 
 
 class ReceiptFilters(ReceiptSwaggerFilters):
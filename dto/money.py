@@ -0,0 +1,30 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional, Union
+
+MINOR_UNITS_EXPONENT = 2
+MINOR_UNIT = Decimal(1).scaleb(-MINOR_UNITS_EXPONENT)
+
+Amount = Union[Decimal, int, float, str]
+
+
+def to_decimal(amount: Amount) -> Decimal:
+    # Floats go through str so that 0.1 is 0.1 and not its binary approximation.
+    return amount if isinstance(amount, Decimal) else Decimal(str(amount))
+
+
+def to_minor(amount: Amount) -> int:
+    minor = to_decimal(amount).scaleb(MINOR_UNITS_EXPONENT)
+    # Amounts almost always come in whole minor units, rounding is only paid for the ones that don't.
+    whole = int(minor)
+    return whole if whole == minor else int(minor.to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor: int) -> Decimal:
+    # Multiplying by a constant is several times cheaper than building a Decimal and scaling it.
+    return MINOR_UNIT * minor
+
+
+def line_total_minor(price_minor: int, quantity: Optional[int], weight: Optional[Amount]) -> int:
+    if weight is not None:
+        return int((price_minor * to_decimal(weight)).to_integral_value(rounding=ROUND_HALF_UP))
+    return price_minor * (quantity if quantity is not None else 1)
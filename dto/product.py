@@ -1,14 +1,15 @@
+from decimal import Decimal
 from typing import TypedDict, Optional
 
 
 class ProductAggregated(TypedDict):
     name: str
-    price: float
+    price: Decimal
     quantity: Optional[int]
-    weight: Optional[float]
-    total: Optional[float]
+    weight: Optional[Decimal]
+    total: Optional[Decimal]
 
 
 class Product(TypedDict):
     name: str
-    price: float
+    price: Decimal
@@ -1,6 +1,7 @@
 from datetime import datetime
+from decimal import Decimal
 from enum import Enum
-from typing import TypedDict, List
+from typing import TypedDict, List, Optional
 
 from dto.product import ProductAggregated
 
@@ -12,19 +13,106 @@ class PaymentType(str, Enum):
 
 class Payment(TypedDict):
     type: PaymentType
-    amount: float
+    amount: Decimal
 
 
 class Receipt(TypedDict):
     id: int
     products: List[ProductAggregated]
     payment: Payment
-    total: float
-    rest: float
+    total: Decimal
+    rest: Decimal
     created_at: datetime
     public_token: str
 
 
+class ReceiptField(str, Enum):
+    ID = "id"
+    CREATED_AT = "created_at"
+    TOTAL = "total"
+    REST = "rest"
+    PAYMENT_TYPE = "payment_type"
+    AMOUNT_PAID = "amount_paid"
+    PUBLIC_TOKEN = "public_token"
+    ITEM_COUNT = "item_count"
+    PRODUCT_NAMES = "product_names"
+
+
+class ReceiptSummary(TypedDict, total=False):
+    id: int
+    created_at: datetime
+    total: Decimal
+    rest: Decimal
+    payment_type: PaymentType
+    amount_paid: Decimal
+    public_token: str
+    item_count: int
+    product_names: List[str]
+
+
+class ReceiptSearchResult(TypedDict):
+    receipt_id: int
+    created_at: datetime
+    public_token: str
+    product: ProductAggregated
+    rank: float
+
+
 class ReceiptCreate(TypedDict):
     products: List[ProductAggregated]
     payment: Payment
+    total: Optional[Decimal]
+    rest: Optional[Decimal]
+
+
+class PendingReceipt(TypedDict):
+    id: int
+    user_id: int
+    created_at: datetime
+    public_token: str
+    receipt: ReceiptCreate
+
+
+class ReceiptBatchStatus(str, Enum):
+    CREATED = "created"
+    DUPLICATE = "duplicate"
+    ERROR = "error"
+
+
+class ReceiptBatchItem(TypedDict):
+    idempotency_key: str
+    receipt: ReceiptCreate
+
+
+class ReceiptBatchResult(TypedDict):
+    idempotency_key: Optional[str]
+    status: ReceiptBatchStatus
+    receipt: Optional[Receipt]
+    detail: Optional[str]
+
+
+class ReceiptExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+class ReceiptStatsGroupBy(str, Enum):
+    DAY = "day"
+    HOUR = "hour"
+    PAYMENT_TYPE = "payment_type"
+    PRODUCT = "product"
+
+
+class ReceiptStats(TypedDict):
+    group: str
+    receipts_count: int
+    total: Decimal
+    quantity: Optional[int]
+    weight: Optional[Decimal]
+
+
+class ReceiptRenderFormat(str, Enum):
+    TEXT = "text"
+    HTML = "html"
+    ESCPOS = "escpos"
+    QR = "qr"
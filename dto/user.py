@@ -2,6 +2,7 @@ from typing import TypedDict
 
 
 class User(TypedDict):
+    id: int
     name: str
     login: str
     hashed_password: str
@@ -11,3 +12,8 @@ class UserCreate(TypedDict):
     name: str
     login: str
     password: str
+
+
+class Principal(TypedDict):
+    user_id: int
+    login: str
@@ -1,15 +1,58 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager, suppress
 
-from database import init_db
-from routes import users_router, auth_router, receipt_router
+from fastapi import Depends, FastAPI
 
-app = FastAPI()
+from database import init_db, close_db, get_unit_of_work
+from database.config import engine
+from database.partitions import start_partition_maintenance
+from middleware import (
+    InstrumentationMiddleware, LoadSheddingMiddleware, RateLimitMiddleware, ReadConsistencyMiddleware,
+)
+from routes import users_router, auth_router, receipt_router, internal_router
+from repositories import ProductRepository
+from services import AuthService, ReceiptService
+from services.write_behind import RECEIPT_WRITE_BEHIND
 
-app.include_router(users_router, prefix="/users")
-app.include_router(auth_router, prefix="/auth")
-app.include_router(receipt_router, prefix="/receipt")
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 
+# Production runs `python -m database.migrations` once before starting the workers.
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
 
-@app.on_event("startup")
-async def on_startup():
-    await init_db()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MIGRATE_ON_STARTUP:
+        await init_db()
+    maintenance = await start_partition_maintenance(engine)
+    await ProductRepository.warm_catalog()
+    if RECEIPT_WRITE_BEHIND:
+        await ReceiptService.start_write_behind()
+    yield
+    if maintenance is not None:
+        maintenance.cancel()
+        with suppress(asyncio.CancelledError):
+            await maintenance
+    await ReceiptService.stop_write_behind()
+    AuthService.password_hasher.shutdown()
+    await close_db()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(dependencies=[Depends(get_unit_of_work)], lifespan=lifespan)
+    # The last added middleware runs first: abusive clients are turned away before they take a concurrency slot.
+    app.add_middleware(ReadConsistencyMiddleware)
+    app.add_middleware(LoadSheddingMiddleware)
+    app.add_middleware(RateLimitMiddleware)
+    app.add_middleware(InstrumentationMiddleware)
+
+    app.include_router(users_router, prefix="/users")
+    app.include_router(auth_router, prefix="/auth")
+    app.include_router(receipt_router, prefix="/receipt")
+    app.include_router(internal_router, prefix="/internal")
+    return app
+
+
+app = create_app()
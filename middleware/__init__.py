@@ -0,0 +1,4 @@
+from .instrumentation import InstrumentationMiddleware
+from .load_shedding import LoadSheddingMiddleware
+from .rate_limit import RateLimitMiddleware, RateLimitRule
+from .read_consistency import ReadConsistencyMiddleware
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import random
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database import QueryStats, collect_query_stats
+from services.metrics import Metrics
+
+# Share of requests whose statements are timed individually; route latency is always recorded.
+SQL_STATS_SAMPLE_RATE = float(os.environ.get("SQL_STATS_SAMPLE_RATE", 1.0))
+
+logger = logging.getLogger(__name__)
+
+
+def server_timing(stats: QueryStats, elapsed: float) -> str:
+    return f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries", app;dur={elapsed * 1000:.2f}'
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app: ASGIApp, sample_rate: float = SQL_STATS_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status = 500
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        with collect_query_stats() if sampled else nullcontext() as stats:
+            async def send_with_timing(message: Message) -> None:
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    if stats is not None:
+                        headers = MutableHeaders(scope=message)
+                        headers.append("Server-Timing", server_timing(stats, time.perf_counter() - started_at))
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                self._record(scope, status, time.perf_counter() - started_at, stats)
+
+    def _record(self, scope: Scope, status: int, elapsed: float, stats: Optional[QueryStats]) -> None:
+        route = scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        method = scope["method"]
+        Metrics.request_duration.observe((method, route_path, str(status)), elapsed)
+        if stats is None:
+            return
+
+        Metrics.request_db_queries.observe((method, route_path), stats.count)
+        Metrics.request_db_duration.observe((method, route_path), stats.duration)
+        if not stats.count:
+            return
+        repeated = stats.repeated()
+        for statement, count in repeated:
+            logger.warning("Possible N+1: %s %s ran %d times: %s", method, route_path, count, statement)
+        logger.info(json.dumps({
+            "method": method,
+            "route": route_path,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 2),
+            "db_queries": stats.count,
+            "db_duration_ms": round(stats.duration * 1000, 2),
+            "slowest": [
+                {"duration_ms": round(duration * 1000, 2), "statement": statement}
+                for duration, statement in stats.slowest
+            ],
+            "repeated": [{"count": count, "statement": statement} for statement, count in repeated],
+        }))
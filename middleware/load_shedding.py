@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from database.config import DB_MAX_OVERFLOW, DB_POOL_SIZE
+from services.metrics import Metrics
+
+# Requests handled at once by this process. Defaults to what the connection pool can serve without waiting,
+# as each request holds at most one pooled connection; 0 disables shedding.
+LOAD_SHEDDING_MAX_CONCURRENCY = int(os.environ.get("LOAD_SHEDDING_MAX_CONCURRENCY", DB_POOL_SIZE + DB_MAX_OVERFLOW))
+# Requests over the limit wait this long for a slot, and at most this many of them wait.
+LOAD_SHEDDING_QUEUE_TIMEOUT = float(os.environ.get("LOAD_SHEDDING_QUEUE_TIMEOUT", 0.5))
+LOAD_SHEDDING_MAX_QUEUE = int(os.environ.get("LOAD_SHEDDING_MAX_QUEUE", LOAD_SHEDDING_MAX_CONCURRENCY * 2))
+LOAD_SHEDDING_RETRY_AFTER = int(os.environ.get("LOAD_SHEDDING_RETRY_AFTER", 1))
+# Liveness probes must keep answering while the process sheds load.
+LOAD_SHEDDING_EXEMPT_PATHS = ("/internal/health",)
+
+
+def service_unavailable(retry_after: int) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Server is overloaded, retry later"},
+        status_code=503,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+class LoadSheddingMiddleware:
+    def __init__(
+            self,
+            app: ASGIApp,
+            max_concurrency: int = LOAD_SHEDDING_MAX_CONCURRENCY,
+            queue_timeout: float = LOAD_SHEDDING_QUEUE_TIMEOUT,
+            max_queue: int = LOAD_SHEDDING_MAX_QUEUE,
+    ):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self._slots is None or scope.get("path") in LOAD_SHEDDING_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if not await self._acquire():
+            Metrics.rejected_requests[("load_shed", "concurrency")] += 1
+            await service_unavailable(LOAD_SHEDDING_RETRY_AFTER)(scope, receive, send)
+            return
+        Metrics.requests_in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            Metrics.requests_in_flight -= 1
+            self._slots.release()
+
+    async def _acquire(self) -> bool:
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return True
+        # Waiting briefly absorbs bursts; a long queue only adds latency to requests that time out anyway.
+        if self.queued >= self.max_queue:
+            return False
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.queued -= 1
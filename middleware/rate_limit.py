@@ -0,0 +1,108 @@
+import os
+from typing import List, Optional, Sequence
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from services.auth import TOKEN_PAYLOAD_STATE_KEY, AuthService
+from services.metrics import Metrics
+from services.rate_limit import RateLimiter
+
+# Requests per second and bucket sizes; a rate of 0 disables the rule.
+RATE_LIMIT_IP_RATE = float(os.environ.get("RATE_LIMIT_IP_RATE", 100))
+RATE_LIMIT_IP_BURST = float(os.environ.get("RATE_LIMIT_IP_BURST", 200))
+RATE_LIMIT_LOGIN_RATE = float(os.environ.get("RATE_LIMIT_LOGIN_RATE", 20))
+RATE_LIMIT_LOGIN_BURST = float(os.environ.get("RATE_LIMIT_LOGIN_BURST", 50))
+RATE_LIMIT_AUTH_RATE = float(os.environ.get("RATE_LIMIT_AUTH_RATE", 1))
+RATE_LIMIT_AUTH_BURST = float(os.environ.get("RATE_LIMIT_AUTH_BURST", 10))
+RATE_LIMIT_RECEIPT_CREATE_RATE = float(os.environ.get("RATE_LIMIT_RECEIPT_CREATE_RATE", 10))
+RATE_LIMIT_RECEIPT_CREATE_BURST = float(os.environ.get("RATE_LIMIT_RECEIPT_CREATE_BURST", 30))
+# Take the client address from X-Forwarded-For, only safe behind a proxy that sets it.
+RATE_LIMIT_TRUST_FORWARDED_FOR = (
+    os.environ.get("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+)
+
+
+class RateLimitRule:
+    def __init__(
+            self,
+            name: str,
+            key: str,
+            rate: float,
+            burst: float,
+            path: Optional[str] = None,
+            methods: Sequence[str] = (),
+    ):
+        # `key` is "ip" or "login"; rules with a path are separate buckets for that route only.
+        self.name = name
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.path = path
+        self.methods = tuple(methods)
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.path is None or self.path == path) and (not self.methods or method in self.methods)
+
+
+DEFAULT_RATE_LIMIT_RULES = [
+    RateLimitRule("ip", "ip", RATE_LIMIT_IP_RATE, RATE_LIMIT_IP_BURST),
+    RateLimitRule("login", "login", RATE_LIMIT_LOGIN_RATE, RATE_LIMIT_LOGIN_BURST),
+    RateLimitRule("auth", "ip", RATE_LIMIT_AUTH_RATE, RATE_LIMIT_AUTH_BURST, path="/auth/token", methods=["POST"]),
+    RateLimitRule(
+        "receipt-create", "login", RATE_LIMIT_RECEIPT_CREATE_RATE, RATE_LIMIT_RECEIPT_CREATE_BURST,
+        path="/receipt/", methods=["POST"],
+    ),
+]
+
+
+def get_client_ip(scope: Scope, headers: Headers) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED_FOR and "x-forwarded-for" in headers:
+        return headers["x-forwarded-for"].split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def get_token_login(scope: Scope, headers: Headers) -> Optional[str]:
+    # Only verified tokens count, so nobody can drain another user's bucket with a forged login. The result is
+    # kept in the request state, where authentication picks it up instead of decoding the token again.
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = AuthService.decode_token(token)
+    scope.setdefault("state", {})[TOKEN_PAYLOAD_STATE_KEY] = payload
+    return payload["login"] if payload is not None else None
+
+
+def too_many_requests(retry_after: int) -> JSONResponse:
+    return JSONResponse(
+        {"detail": "Too many requests"},
+        status_code=429,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+class RateLimitMiddleware:
+    def __init__(self, app: ASGIApp, rules: Optional[List[RateLimitRule]] = None):
+        self.app = app
+        self.rules = [rule for rule in (rules or DEFAULT_RATE_LIMIT_RULES) if rule.rate > 0]
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not RateLimiter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        keys = {"ip": get_client_ip(scope, headers), "login": get_token_login(scope, headers)}
+        method = scope["method"]
+        for rule in self.rules:
+            if keys[rule.key] is None or not rule.matches(method, path):
+                continue
+            retry_after = await RateLimiter.hit((rule.name, keys[rule.key]), rule.rate, rule.burst)
+            if retry_after is not None:
+                Metrics.rejected_requests[("rate_limit", rule.name)] += 1
+                await too_many_requests(retry_after)(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
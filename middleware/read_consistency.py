@@ -0,0 +1,46 @@
+import math
+import os
+import time
+from typing import Optional
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database import has_replicas, track_read_consistency
+from database.replicas import DB_REPLICA_READ_YOUR_WRITES_SECONDS
+
+# Holds the time of the client's last write, so any worker keeps that client's reads on the primary.
+READ_CONSISTENCY_COOKIE = os.environ.get("READ_CONSISTENCY_COOKIE", "last_write_at")
+
+
+def parse_last_write_at(value: Optional[str]) -> Optional[float]:
+    try:
+        last_write_at = float(value or "")
+    except ValueError:
+        return None
+    return last_write_at if math.isfinite(last_write_at) else None
+
+
+def last_write_cookie(last_write_at: float) -> str:
+    max_age = math.ceil(DB_REPLICA_READ_YOUR_WRITES_SECONDS)
+    return f"{READ_CONSISTENCY_COOKIE}={last_write_at:.3f}; Max-Age={max_age}; Path=/; HttpOnly; SameSite=Lax"
+
+
+class ReadConsistencyMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not has_replicas():
+            await self.app(scope, receive, send)
+            return
+
+        last_write_at = parse_last_write_at(HTTPConnection(scope).cookies.get(READ_CONSISTENCY_COOKIE))
+        with track_read_consistency(last_write_at) as consistency:
+            async def send_with_marker(message: Message) -> None:
+                if message["type"] == "http.response.start" and consistency.wrote:
+                    MutableHeaders(scope=message).append("Set-Cookie", last_write_cookie(time.time()))
+                await send(message)
+
+            await self.app(scope, receive, send_with_marker)
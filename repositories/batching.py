@@ -0,0 +1,24 @@
+from typing import Iterator, List, Sequence, TypeVar
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+
+# asyncpg sends at most this many bind parameters with one statement.
+MAX_BIND_PARAMETERS = 32767
+
+T = TypeVar("T")
+
+
+def chunked(items: Sequence[T], parameters_per_item: int = 1) -> Iterator[List[T]]:
+    size = max(MAX_BIND_PARAMETERS // max(parameters_per_item, 1), 1)
+    for start in range(0, len(items), size):
+        yield list(items[start:start + size])
+
+
+def insert_parameters_per_row(table, row: dict) -> int:
+    # Counted on the compiled statement, as columns with Python-side defaults are bound too.
+    return len(insert(table).values([row]).compile(dialect=postgresql.dialect()).params)
+
+
+def chunked_rows(table, rows: List[dict]) -> Iterator[List[dict]]:
+    return chunked(rows, insert_parameters_per_row(table, rows[0]) if rows else 1)
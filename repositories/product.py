@@ -1,24 +1,124 @@
-from typing import Optional
+import os
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
 
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_session, Product as ProductDBModel
 from dto import ProductAggregated
+from repositories.batching import chunked, chunked_rows
+from services.cache import TTLCache
+
+PRODUCT_CACHE_SIZE = int(os.environ.get("PRODUCT_CACHE_SIZE", 50_000))
 
 
 class ProductRepository:
+    # Products are never updated or deleted, so committed rows can be cached without a TTL.
+    catalog_cache = TTLCache(maxsize=PRODUCT_CACHE_SIZE)
+
     @classmethod
     async def exists(cls, product: ProductAggregated) -> bool:
-        async with get_session() as session:
-            data = (await session.execute(
-                select(ProductDBModel).where(ProductDBModel.name == product["name"])
-            )).scalars().first()
-        return bool(data)
+        return bool(await cls.get_id_by_name(product["name"]))
 
     @classmethod
     async def get_id_by_name(cls, name: str) -> Optional[str]:
         async with get_session() as session:
-            product_id = (await session.execute(
-                select(ProductDBModel.id).where(ProductDBModel.name == name)
-            )).scalars().first()
-        return product_id
+            catalog = await cls._get_by_names(session, [name])
+        return catalog[name][0] if name in catalog else None
+
+    @classmethod
+    async def get_prices(cls, products: List[ProductAggregated]) -> Dict[str, Decimal]:
+        # The prices products are stored with: the catalog's, or the submitted one for a product not in the catalog yet.
+        catalog = {}
+        misses = []
+        for name in dict.fromkeys(product["name"] for product in products):
+            product = cls.catalog_cache.get(name)
+            if product is None:
+                misses.append(name)
+            else:
+                catalog[name] = product
+        # A connection is only checked out for products the catalog cache misses.
+        if misses:
+            async with get_session() as session:
+                catalog.update(await cls._get_by_names(session, misses))
+        prices = {}
+        for product in products:
+            name = product["name"]
+            prices.setdefault(name, catalog[name][1] if name in catalog else product["price"])
+        return prices
+
+    @classmethod
+    async def warm_catalog(cls, limit: int = PRODUCT_CACHE_SIZE) -> int:
+        async with get_session() as session:
+            rows = (await session.execute(
+                select(ProductDBModel.id, ProductDBModel.name, ProductDBModel.price)
+                .order_by(ProductDBModel.id.desc())
+                .limit(limit)
+            )).all()
+        for row in reversed(rows):
+            cls.catalog_cache.set(row.name, (row.id, row.price))
+        return len(rows)
+
+    @classmethod
+    async def _select_by_names(cls, session: AsyncSession, names: List[str]) -> Dict[str, Tuple[int, Decimal]]:
+        rows = []
+        for chunk in chunked(names):
+            rows.extend((await session.execute(
+                select(ProductDBModel.id, ProductDBModel.name, ProductDBModel.price)
+                .where(ProductDBModel.name.in_(chunk))
+            )).all())
+        return {row.name: (row.id, row.price) for row in rows}
+
+    @classmethod
+    async def _get_by_names(cls, session: AsyncSession, names: List[str]) -> Dict[str, Tuple[int, Decimal]]:
+        catalog = {}
+        misses = []
+        for name in names:
+            product = cls.catalog_cache.get(name)
+            if product is None:
+                misses.append(name)
+            else:
+                catalog[name] = product
+        if misses:
+            selected = await cls._select_by_names(session, misses)
+            for name, product in selected.items():
+                cls.catalog_cache.set(name, product)
+            catalog.update(selected)
+        return catalog
+
+    @classmethod
+    async def get_or_create_many(
+            cls,
+            session: AsyncSession,
+            products: List[ProductAggregated],
+    ) -> Dict[str, Tuple[int, Decimal]]:
+        prices = {}
+        for product in products:
+            prices.setdefault(product["name"], product["price"])
+        if not prices:
+            return {}
+
+        catalog = await cls._get_by_names(session, list(prices))
+        missing = [name for name in prices if name not in catalog]
+        if not missing:
+            return catalog
+
+        # Freshly inserted rows are not cached: the surrounding transaction may still roll back.
+        for chunk in chunked_rows(ProductDBModel, [{"name": name, "price": prices[name]} for name in missing]):
+            created = (await session.execute(
+                insert(ProductDBModel)
+                .values(chunk)
+                .on_conflict_do_nothing(index_elements=[ProductDBModel.name])
+                .returning(ProductDBModel.id, ProductDBModel.name, ProductDBModel.price)
+            )).all()
+            catalog.update({row.name: (row.id, row.price) for row in created})
+
+        # Rows skipped by ON CONFLICT were inserted concurrently by another transaction.
+        conflicted = [name for name in missing if name not in catalog]
+        if conflicted:
+            for name in conflicted:
+                cls.catalog_cache.invalidate(name)
+            catalog.update(await cls._get_by_names(session, conflicted))
+        return catalog
@@ -1,21 +1,91 @@
-from typing import List, Optional
+import json
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
-from sqlalchemy import select, Select
+from sqlalchemy import and_, distinct, exists, func, literal, or_, select, tuple_, Select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
-from database import get_session, Receipt as ReceiptDBModel, Product as ProductDBModel, ReceiptProductAssociation
-from dto import ReceiptCreate, Receipt, Payment, PaymentType, ProductAggregated, ReceiptFilters
+from database import (
+    get_session, get_read_session, has_replicas, mark_written, Receipt as ReceiptDBModel, Product as ProductDBModel,
+    ReceiptProductAssociation, ReceiptIdempotencyKey, ReceiptDailyStats,
+)
+from database.models import PRODUCT_NAMES_PREVIEW_SIZE
+from dto import (
+    ReceiptCreate, Receipt, Payment, PaymentType, PendingReceipt, ProductAggregated, ReceiptFilters, ReceiptBatchItem,
+    ReceiptBatchStatus, ReceiptStats, ReceiptStatsGroupBy, ReceiptCountMode, ReceiptField, ReceiptSummary,
+    ReceiptSearchResult,
+)
+from repositories.batching import chunked_rows
 from repositories.product import ProductRepository
 
+# Below this planner estimate the exact count is cheap enough to run instead.
+RECEIPT_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get("RECEIPT_COUNT_ESTIMATE_THRESHOLD", 10_000))
+# Best matching products bought by the user whose line items are searched.
+RECEIPT_SEARCH_MAX_PRODUCTS = int(os.environ.get("RECEIPT_SEARCH_MAX_PRODUCTS", 100))
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 
 class ReceiptRepository:
     @classmethod
-    def _apply_filters(cls, statement: Select, filters: ReceiptFilters) -> Select:
-        statement = statement.order_by(ReceiptDBModel.id)
+    def _consistency_key(cls, user_id: Optional[int]) -> Optional[tuple]:
+        return ("receipts", user_id) if user_id is not None else None
+
+    @classmethod
+    def _apply_pagination(cls, statement: Select, filters: ReceiptFilters) -> Select:
+        if filters.after is not None and filters.before is not None:
+            raise ValueError("Only one of 'after' and 'before' cursors can be used")
+        if (filters.after is not None or filters.before is not None) and filters.offset:
+            raise ValueError("Offset can't be combined with a cursor")
+        if filters.before is not None:
+            statement = statement.where(ReceiptDBModel.id < filters.decode_cursor(filters.before))
+            statement = statement.order_by(ReceiptDBModel.id.desc())
+        else:
+            if filters.after is not None:
+                statement = statement.where(ReceiptDBModel.id > filters.decode_cursor(filters.after))
+            statement = statement.order_by(ReceiptDBModel.id)
         if filters.limit is not None:
             statement = statement.limit(filters.limit)
-        if filters.offset is not None:
+        if filters.offset:
             statement = statement.offset(filters.offset)
+        return statement
+
+    @classmethod
+    def _created_at_range(cls, column, filters: ReceiptFilters) -> list:
+        # Repeated on every partitioned table of a query so the planner can prune its monthly partitions.
+        conditions = []
+        if filters.min_created_at is not None:
+            conditions.append(column >= filters.min_created_at)
+        if filters.max_created_at is not None:
+            conditions.append(column <= filters.max_created_at)
+        return conditions
+
+    @classmethod
+    def _bought_by(cls, user_id: int, *conditions):
+        # Whether the user has a line item of the product in the outer query.
+        return exists().where(
+            ReceiptProductAssociation.product_id == ProductDBModel.id,
+            ReceiptDBModel.id == ReceiptProductAssociation.receipt_id,
+            ReceiptDBModel.created_at == ReceiptProductAssociation.receipt_created_at,
+            ReceiptDBModel.user_id == user_id,
+            *conditions,
+        )
+
+    @classmethod
+    def _products_join(cls, filters: ReceiptFilters):
+        return and_(
+            ReceiptProductAssociation.receipt_id == ReceiptDBModel.id,
+            ReceiptProductAssociation.receipt_created_at == ReceiptDBModel.created_at,
+            *cls._created_at_range(ReceiptProductAssociation.receipt_created_at, filters),
+        )
+
+    @classmethod
+    def _apply_filters(cls, statement: Select, filters: ReceiptFilters) -> Select:
         if filters.user_id is not None:
             statement = statement.where(ReceiptDBModel.user_id == filters.user_id)
         if filters.max_created_at is not None:
@@ -66,8 +136,12 @@ class ReceiptRepository:
                 .joinedload(ReceiptProductAssociation.product))
             .where(ReceiptDBModel.id == receipt_id)
         )
-        async with get_session() as session:
+        async with get_read_session() as session:
             data = (await session.execute(statement)).scalars().first()
+        if not data and has_replicas():
+            # The receipt may not have reached the replica yet.
+            async with get_session() as session:
+                data = (await session.execute(statement)).scalars().first()
 
         if not data:
             raise ValueError(f"Receipt with id {receipt_id} not found")
@@ -75,70 +149,558 @@ class ReceiptRepository:
         receipt = cls._prepare_receipt(data)
         return receipt
 
+    @classmethod
+    async def get_summaries(cls, filters: ReceiptFilters, fields: List[ReceiptField]) -> List[ReceiptSummary]:
+        # Reads only the requested receipt columns, without line items.
+        columns = [getattr(ReceiptDBModel, field.value).label(field.value) for field in fields]
+        page = cls._apply_pagination(cls._apply_filters(select(*columns), filters), filters).subquery()
+        statement = select(page).order_by(page.c.id)
+        async with get_read_session(cls._consistency_key(filters.user_id)) as session:
+            rows = (await session.execute(statement)).all()
+        return [ReceiptSummary(**row._mapping) for row in rows]
+
     @classmethod
     async def get(cls, filters: Optional[ReceiptFilters] = None) -> List[Receipt]:
+        filters = filters or ReceiptFilters()
+        page = cls._apply_pagination(cls._apply_filters(select(ReceiptDBModel.id), filters), filters)
         statement = (
             select(ReceiptDBModel)
             .options(
-                joinedload(ReceiptDBModel.products)
+                joinedload(ReceiptDBModel.products.and_(
+                    *cls._created_at_range(ReceiptProductAssociation.receipt_created_at, filters)
+                ))
                 .joinedload(ReceiptProductAssociation.product)
             )
+            .where(ReceiptDBModel.id.in_(page.scalar_subquery()))
+            .where(*cls._created_at_range(ReceiptDBModel.created_at, filters))
+            .order_by(ReceiptDBModel.id)
         )
-        statement = cls._apply_filters(statement, filters)
-        async with get_session() as session:
+        async with get_read_session(cls._consistency_key(filters.user_id)) as session:
             data = (await session.execute(statement)).unique().scalars().all()
+        if not data and filters.public_token is not None and has_replicas():
+            async with get_session() as session:
+                data = (await session.execute(statement)).unique().scalars().all()
 
         receipts = [cls._prepare_receipt(row) for row in data]
 
         return receipts
 
     @classmethod
-    async def save(cls, receipt: ReceiptCreate, user_id: int) -> Receipt:
-        amount_paid = receipt["payment"]["amount"]
-        total = sum([p["price"] * p.get("quantity", 1) for p in receipt["products"]])
-        rest = amount_paid - total
-        receipt_entity = ReceiptDBModel(
-            user_id=user_id,
-            total=total,
-            amount_paid=amount_paid,
-            payment_type=receipt["payment"]["type"].value,
-            rest=rest,
+    async def stream(cls, filters: ReceiptFilters, batch_size: int = 1000) -> AsyncIterator[Receipt]:
+        statement = (
+            select(
+                ReceiptDBModel.id,
+                ReceiptDBModel.created_at,
+                ReceiptDBModel.amount_paid,
+                ReceiptDBModel.payment_type,
+                ReceiptDBModel.total,
+                ReceiptDBModel.rest,
+                ReceiptDBModel.public_token,
+                ProductDBModel.name.label("product_name"),
+                ProductDBModel.price.label("product_price"),
+                ReceiptProductAssociation.quantity.label("product_quantity"),
+                ReceiptProductAssociation.weight.label("product_weight"),
+                ReceiptProductAssociation.total.label("product_total"),
+            )
+            .outerjoin(ReceiptProductAssociation, cls._products_join(filters))
+            .outerjoin(ProductDBModel, ProductDBModel.id == ReceiptProductAssociation.product_id)
+            .order_by(ReceiptDBModel.id, ReceiptProductAssociation.id)
+            .execution_options(yield_per=batch_size)
+        )
+        statement = cls._apply_filters(statement, filters)
+        if filters.after is not None:
+            statement = statement.where(ReceiptDBModel.id > filters.decode_cursor(filters.after))
+
+        async with get_read_session(cls._consistency_key(filters.user_id)) as session:
+            result = await session.stream(statement)
+            receipt = None
+            async for row in result:
+                if receipt is None or receipt["id"] != row.id:
+                    if receipt is not None:
+                        yield receipt
+                    receipt = Receipt(
+                        id=row.id,
+                        created_at=row.created_at,
+                        payment=Payment(
+                            amount=row.amount_paid,
+                            type=PaymentType(row.payment_type),
+                        ),
+                        products=[],
+                        rest=row.rest,
+                        total=row.total,
+                        public_token=row.public_token,
+                    )
+                if row.product_name is not None:
+                    receipt["products"].append(ProductAggregated(
+                        name=row.product_name,
+                        price=row.product_price,
+                        quantity=row.product_quantity,
+                        weight=row.product_weight,
+                        total=row.product_total,
+                    ))
+            if receipt is not None:
+                yield receipt
+
+    @classmethod
+    async def count(cls, filters: ReceiptFilters, mode: ReceiptCountMode = ReceiptCountMode.EXACT) -> int:
+        statement = cls._apply_filters(select(func.count(ReceiptDBModel.id)), filters)
+        async with get_read_session(cls._consistency_key(filters.user_id)) as session:
+            if mode == ReceiptCountMode.ESTIMATED:
+                query = cls._apply_filters(select(ReceiptDBModel.id), filters).compile(
+                    dialect=session.bind.dialect,
+                    compile_kwargs={"literal_binds": True},
+                )
+                connection = await session.connection()
+                plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                estimate = int(plan[0]["Plan"]["Plan Rows"])
+                if estimate >= RECEIPT_COUNT_ESTIMATE_THRESHOLD:
+                    return estimate
+            return (await session.execute(statement)).scalar()
+
+    @classmethod
+    async def search(cls, query: str, filters: ReceiptFilters) -> List[ReceiptSearchResult]:
+        # Products are matched on the trigram index first, so only line items of a few products are joined. They are
+        # limited to the user's products before the cap, so better matches bought by others can't push them out.
+        rank = func.word_similarity(query, ProductDBModel.name)
+        matches = (
+            select(ProductDBModel.id, ProductDBModel.name, ProductDBModel.price, rank.label("rank"))
+            .where(or_(
+                ProductDBModel.name.ilike(f"%{_escape_like(query)}%"),
+                literal(query).op("<%")(ProductDBModel.name),
+            ))
+            .where(cls._bought_by(filters.user_id, *cls._created_at_range(ReceiptDBModel.created_at, filters)))
+            .order_by(rank.desc())
+            .limit(RECEIPT_SEARCH_MAX_PRODUCTS)
+            .cte("matches")
+        )
+        statement = (
+            select(
+                ReceiptDBModel.id,
+                ReceiptDBModel.created_at,
+                ReceiptDBModel.public_token,
+                matches.c.name,
+                matches.c.price,
+                matches.c.rank,
+                ReceiptProductAssociation.quantity,
+                ReceiptProductAssociation.weight,
+                ReceiptProductAssociation.total,
+            )
+            .select_from(matches)
+            .join(ReceiptProductAssociation, ReceiptProductAssociation.product_id == matches.c.id)
+            .join(ReceiptDBModel, cls._products_join(filters))
+            .order_by(matches.c.rank.desc(), ReceiptDBModel.created_at.desc(), ReceiptProductAssociation.id)
+        )
+        statement = cls._apply_filters(statement, filters)
+        if filters.limit is not None:
+            statement = statement.limit(filters.limit)
+        if filters.offset:
+            statement = statement.offset(filters.offset)
+
+        async with get_read_session(cls._consistency_key(filters.user_id)) as session:
+            rows = (await session.execute(statement)).all()
+        return [
+            ReceiptSearchResult(
+                receipt_id=row.id,
+                created_at=row.created_at,
+                public_token=row.public_token,
+                product=ProductAggregated(
+                    name=row.name,
+                    price=row.price,
+                    quantity=row.quantity,
+                    weight=row.weight,
+                    total=row.total,
+                ),
+                rank=row.rank,
+            )
+            for row in rows
+        ]
+
+    @classmethod
+    async def suggest_product_names(cls, prefix: str, user_id: int, limit: int) -> List[str]:
+        # Prefix matches are served by the same trigram index; only products the user has bought are suggested.
+        statement = (
+            select(ProductDBModel.name)
+            .where(ProductDBModel.name.ilike(f"{_escape_like(prefix)}%"))
+            .where(cls._bought_by(user_id))
+            .order_by(func.length(ProductDBModel.name), ProductDBModel.name)
+            .limit(limit)
         )
-        products_to_create = [
-            ProductDBModel(
-                name=product["name"],
-                price=product["price"],
+        async with get_read_session(cls._consistency_key(user_id)) as session:
+            return list((await session.execute(statement)).scalars().all())
+
+    @classmethod
+    def _stats_group(cls, group_by: ReceiptStatsGroupBy):
+        created_at_utc = func.timezone("UTC", ReceiptDBModel.created_at)
+        if group_by == ReceiptStatsGroupBy.DAY:
+            return func.date(created_at_utc)
+        if group_by == ReceiptStatsGroupBy.HOUR:
+            return func.date_trunc("hour", created_at_utc)
+        if group_by == ReceiptStatsGroupBy.PAYMENT_TYPE:
+            return ReceiptDBModel.payment_type
+        return ProductDBModel.name
+
+    @classmethod
+    async def _get_raw_stats(
+            cls,
+            session: AsyncSession,
+            filters: ReceiptFilters,
+            group_by: ReceiptStatsGroupBy,
+    ) -> List[ReceiptStats]:
+        group = cls._stats_group(group_by).label("group")
+        if group_by == ReceiptStatsGroupBy.PRODUCT:
+            statement = (
+                select(
+                    group,
+                    func.count(distinct(ReceiptDBModel.id)).label("receipts_count"),
+                    func.sum(ReceiptProductAssociation.total).label("total"),
+                    func.sum(ReceiptProductAssociation.quantity).label("quantity"),
+                    func.sum(ReceiptProductAssociation.weight).label("weight"),
+                )
+                .join(ReceiptProductAssociation, cls._products_join(filters))
+                .join(ProductDBModel, ProductDBModel.id == ReceiptProductAssociation.product_id)
+                .order_by(func.sum(ReceiptProductAssociation.total).desc())
             )
-            for product in receipt["products"]
-            if not (await ProductRepository.exists(product))
+        else:
+            statement = select(
+                group,
+                func.count(ReceiptDBModel.id).label("receipts_count"),
+                func.sum(ReceiptDBModel.total).label("total"),
+            ).order_by(group)
+        statement = cls._apply_filters(statement.group_by(group), filters)
+        if filters.limit is not None:
+            statement = statement.limit(filters.limit)
+
+        rows = (await session.execute(statement)).all()
+        return [
+            ReceiptStats(
+                group=row.group.isoformat() if isinstance(row.group, (date, datetime)) else row.group,
+                receipts_count=row.receipts_count,
+                total=row.total,
+                quantity=getattr(row, "quantity", None),
+                weight=getattr(row, "weight", None),
+            )
+            for row in rows
         ]
 
+    @classmethod
+    async def _get_rollup_stats(
+            cls,
+            session: AsyncSession,
+            filters: ReceiptFilters,
+            group_by: ReceiptStatsGroupBy,
+    ) -> List[ReceiptStats]:
+        # Whole UTC days inside the range come from the rollup, the partial days at the edges from receipts.
+        first_day = last_day = None
+        edges = []
+        if filters.min_created_at is not None:
+            min_created_at = filters.min_created_at.astimezone(timezone.utc)
+            first_day = min_created_at.date()
+            if min_created_at.timetz() != time(tzinfo=timezone.utc):
+                first_day += timedelta(days=1)
+                edges.append(filters.model_copy(update={
+                    "max_created_at": datetime.combine(first_day, time(), timezone.utc) - timedelta(microseconds=1),
+                }))
+        if filters.max_created_at is not None:
+            last_day = filters.max_created_at.astimezone(timezone.utc).date()
+            edges.append(filters.model_copy(update={
+                "min_created_at": datetime.combine(last_day, time(), timezone.utc),
+            }))
+        if first_day is not None and last_day is not None and first_day >= last_day:
+            return await cls._get_raw_stats(session, filters, group_by)
+
+        group = ReceiptDailyStats.day if group_by == ReceiptStatsGroupBy.DAY else ReceiptDailyStats.payment_type
+        statement = (
+            select(
+                group.label("group"),
+                func.sum(ReceiptDailyStats.receipts_count).label("receipts_count"),
+                func.sum(ReceiptDailyStats.total).label("total"),
+            )
+            .where(ReceiptDailyStats.user_id == filters.user_id)
+            .group_by(group)
+        )
+        if first_day is not None:
+            statement = statement.where(ReceiptDailyStats.day >= first_day)
+        if last_day is not None:
+            statement = statement.where(ReceiptDailyStats.day < last_day)
+        if filters.payment_type is not None:
+            statement = statement.where(ReceiptDailyStats.payment_type == filters.payment_type.value)
+
+        stats = {}
+        for row in (await session.execute(statement)).all():
+            key = row.group.isoformat() if isinstance(row.group, date) else row.group
+            stats[key] = ReceiptStats(
+                group=key, receipts_count=row.receipts_count, total=row.total, quantity=None, weight=None,
+            )
+        for edge in edges:
+            for item in await cls._get_raw_stats(session, edge.model_copy(update={"limit": None}), group_by):
+                if item["group"] in stats:
+                    stats[item["group"]]["receipts_count"] += item["receipts_count"]
+                    stats[item["group"]]["total"] += item["total"]
+                else:
+                    stats[item["group"]] = item
+        return [stats[key] for key in sorted(stats)]
+
+    @classmethod
+    async def get_stats(cls, filters: ReceiptFilters, group_by: ReceiptStatsGroupBy) -> List[ReceiptStats]:
+        async with get_read_session(cls._consistency_key(filters.user_id)) as session:
+            if (
+                    group_by in (ReceiptStatsGroupBy.DAY, ReceiptStatsGroupBy.PAYMENT_TYPE)
+                    and filters.user_id is not None
+                    and filters.min_total is None
+                    and filters.max_total is None
+            ):
+                stats = await cls._get_rollup_stats(session, filters, group_by)
+                return stats[:filters.limit] if filters.limit is not None else stats
+            return await cls._get_raw_stats(session, filters, group_by)
+
+    @classmethod
+    async def allocate_ids(cls, session: AsyncSession, count: int) -> List[int]:
+        return list((await session.execute(
+            select(func.nextval("receipts_id_seq")).select_from(func.generate_series(1, count))
+        )).scalars().all())
+
+    @classmethod
+    async def reserve_ids(cls, count: int) -> List[int]:
         async with get_session() as session:
-            session.add(receipt_entity)
-            await session.flush()
-            receipt_id = receipt_entity.id
+            return await cls.allocate_ids(session, count)
 
-            for product in products_to_create:
-                session.add(product)
-            await session.commit()
+    @classmethod
+    def _summary_values(cls, receipt: ReceiptCreate) -> dict:
+        return dict(
+            item_count=len(receipt["products"]),
+            product_names=[product["name"] for product in receipt["products"][:PRODUCT_NAMES_PREVIEW_SIZE]],
+        )
+
+    @classmethod
+    async def _insert(
+            cls,
+            session: AsyncSession,
+            receipts: Dict[Optional[str], ReceiptCreate],
+            user_id: int,
+    ) -> Dict[Optional[str], Receipt]:
+        catalog = await ProductRepository.get_or_create_many(
+            session, [product for receipt in receipts.values() for product in receipt["products"]]
+        )
 
-            for product in receipt["products"]:
-                product_id = await ProductRepository.get_id_by_name(product["name"])
+        receipt_ids = None
+        if any(key is not None for key in receipts):
+            # Only receipts whose key is new get inserted; the key table is the one place their uniqueness
+            # can be enforced across partitions.
+            allocated = dict(zip(receipts, await cls.allocate_ids(session, len(receipts))))
+            key_rows = [
+                dict(user_id=user_id, idempotency_key=key, receipt_id=receipt_id)
+                for key, receipt_id in allocated.items() if key is not None
+            ]
+            keys = []
+            key_rows = [dict(row, receipt_created_at=func.now()) for row in key_rows]
+            for chunk in chunked_rows(ReceiptIdempotencyKey, key_rows):
+                keys.extend((await session.execute(
+                    insert(ReceiptIdempotencyKey)
+                    .values(chunk)
+                    .on_conflict_do_nothing(
+                        index_elements=[ReceiptIdempotencyKey.user_id, ReceiptIdempotencyKey.idempotency_key],
+                    )
+                    .returning(ReceiptIdempotencyKey.idempotency_key)
+                )).scalars().all())
+            receipt_ids = {key: allocated[key] for key in [None, *keys] if key in allocated}
 
-                if not product_id:
-                    raise ValueError(f"Product '{product['name']}' not found.")
+        values = []
+        for idempotency_key, receipt in receipts.items():
+            if receipt_ids is not None and idempotency_key not in receipt_ids:
+                continue
+            row = dict(
+                user_id=user_id,
+                total=receipt["total"],
+                amount_paid=receipt["payment"]["amount"],
+                payment_type=receipt["payment"]["type"].value,
+                rest=receipt["rest"],
+                idempotency_key=idempotency_key,
+                **cls._summary_values(receipt),
+            )
+            if receipt_ids is not None:
+                row["id"] = receipt_ids[idempotency_key]
+            values.append(row)
+        if not values:
+            return {}
+
+        records = []
+        for chunk in chunked_rows(ReceiptDBModel, values):
+            records.extend((await session.execute(
+                insert(ReceiptDBModel)
+                .values(chunk)
+                .returning(
+                    ReceiptDBModel.id,
+                    ReceiptDBModel.user_id,
+                    ReceiptDBModel.created_at,
+                    ReceiptDBModel.public_token,
+                    ReceiptDBModel.idempotency_key,
+                    ReceiptDBModel.total,
+                    ReceiptDBModel.amount_paid,
+                    ReceiptDBModel.payment_type,
+                    ReceiptDBModel.rest,
+                )
+            )).all())
 
-                receipt_product = ReceiptProductAssociation(
-                    receipt_id=receipt_id,
+        created = {}
+        associations = []
+        for record in records:
+            products = []
+            for product in receipts[record.idempotency_key]["products"]:
+                product_id, price = catalog[product["name"]]
+                associations.append(dict(
+                    receipt_id=record.id,
+                    receipt_created_at=record.created_at,
                     product_id=product_id,
-                    quantity=product.get("quantity", 1),
-                    weight=product.get("weight"),
-                    total=product["price"] * product.get("quantity", 1),
+                    quantity=product["quantity"],
+                    weight=product["weight"],
+                    total=product["total"],
+                ))
+                products.append(ProductAggregated(
+                    name=product["name"],
+                    price=price,
+                    quantity=product["quantity"],
+                    weight=product["weight"],
+                    total=product["total"],
+                ))
+            created[record.idempotency_key] = Receipt(
+                id=record.id,
+                created_at=record.created_at,
+                payment=Payment(
+                    amount=record.amount_paid,
+                    type=PaymentType(record.payment_type),
+                ),
+                products=products,
+                rest=record.rest,
+                total=record.total,
+                public_token=record.public_token,
+            )
+        for chunk in chunked_rows(ReceiptProductAssociation, associations):
+            await session.execute(insert(ReceiptProductAssociation).values(chunk))
+        if records:
+            await cls._update_daily_stats(session, records)
+        mark_written(cls._consistency_key(user_id))
+        return created
+
+    @classmethod
+    async def _update_daily_stats(cls, session: AsyncSession, records: list) -> None:
+        rollup = {}
+        for record in records:
+            key = (record.user_id, record.created_at.astimezone(timezone.utc).date(), record.payment_type)
+            receipts_count, total = rollup.get(key, (0, 0))
+            rollup[key] = (receipts_count + 1, total + record.total)
+
+        # Sorted so concurrent batches lock the rollup rows in the same order.
+        statement = insert(ReceiptDailyStats).values([
+            dict(user_id=user_id, day=day, payment_type=payment_type, receipts_count=receipts_count, total=total)
+            for (user_id, day, payment_type), (receipts_count, total) in sorted(rollup.items())
+        ])
+        await session.execute(statement.on_conflict_do_update(
+            index_elements=[ReceiptDailyStats.user_id, ReceiptDailyStats.day, ReceiptDailyStats.payment_type],
+            set_={
+                "receipts_count": ReceiptDailyStats.receipts_count + statement.excluded.receipts_count,
+                "total": ReceiptDailyStats.total + statement.excluded.total,
+            },
+        ))
+
+    @classmethod
+    async def save_pending(cls, pending: List[PendingReceipt]) -> int:
+        # Ids and created_at are assigned up front, so receipts that are already stored conflict on the primary
+        # key and are skipped together with their line items and rollup increments.
+        if not pending:
+            return 0
+        async with get_session() as session:
+            catalog = await ProductRepository.get_or_create_many(
+                session, [product for item in pending for product in item["receipt"]["products"]]
+            )
+            rows = [
+                dict(
+                    id=item["id"],
+                    user_id=item["user_id"],
+                    created_at=item["created_at"],
+                    public_token=item["public_token"],
+                    total=item["receipt"]["total"],
+                    amount_paid=item["receipt"]["payment"]["amount"],
+                    payment_type=item["receipt"]["payment"]["type"].value,
+                    rest=item["receipt"]["rest"],
+                    **cls._summary_values(item["receipt"]),
+                )
+                for item in pending
+            ]
+            records = []
+            for chunk in chunked_rows(ReceiptDBModel, rows):
+                records.extend((await session.execute(
+                    insert(ReceiptDBModel)
+                    .values(chunk)
+                    .on_conflict_do_nothing(index_elements=[ReceiptDBModel.id, ReceiptDBModel.created_at])
+                    .returning(
+                        ReceiptDBModel.id,
+                        ReceiptDBModel.user_id,
+                        ReceiptDBModel.created_at,
+                        ReceiptDBModel.payment_type,
+                        ReceiptDBModel.total,
+                    )
+                )).all())
+
+            inserted = {record.id for record in records}
+            associations = [
+                dict(
+                    receipt_id=item["id"],
+                    receipt_created_at=item["created_at"],
+                    product_id=catalog[product["name"]][0],
+                    quantity=product["quantity"],
+                    weight=product["weight"],
+                    total=product["total"],
                 )
-                session.add(receipt_product)
+                for item in pending if item["id"] in inserted
+                for product in item["receipt"]["products"]
+            ]
+            for chunk in chunked_rows(ReceiptProductAssociation, associations):
+                await session.execute(insert(ReceiptProductAssociation).values(chunk))
+            if records:
+                await cls._update_daily_stats(session, records)
+        for user_id in {record.user_id for record in records}:
+            mark_written(cls._consistency_key(user_id))
+        return len(records)
+
+    @classmethod
+    async def save(cls, receipt: ReceiptCreate, user_id: int) -> Receipt:
+        async with get_session() as session:
+            created = await cls._insert(session, {None: receipt}, user_id)
+        return created[None]
+
+    @classmethod
+    async def save_batch(
+            cls,
+            items: List[ReceiptBatchItem],
+            user_id: int,
+    ) -> Dict[str, Tuple[ReceiptBatchStatus, Receipt]]:
+        if not items:
+            return {}
+        receipts = {item["idempotency_key"]: item["receipt"] for item in items}
 
-            await session.commit()
+        async with get_session() as session:
+            created = await cls._insert(session, receipts, user_id)
 
-        created_receipt = await cls.get_by_id(receipt_id)
+            duplicates = {}
+            duplicate_keys = [key for key in receipts if key not in created]
+            if duplicate_keys:
+                statement = (
+                    select(ReceiptDBModel)
+                    .options(
+                        joinedload(ReceiptDBModel.products)
+                        .joinedload(ReceiptProductAssociation.product)
+                    )
+                    .where(tuple_(ReceiptDBModel.id, ReceiptDBModel.created_at).in_(
+                        select(ReceiptIdempotencyKey.receipt_id, ReceiptIdempotencyKey.receipt_created_at)
+                        .where(ReceiptIdempotencyKey.user_id == user_id)
+                        .where(ReceiptIdempotencyKey.idempotency_key.in_(duplicate_keys))
+                    ))
+                )
+                data = (await session.execute(statement)).unique().scalars().all()
+                duplicates = {row.idempotency_key: cls._prepare_receipt(row) for row in data}
 
-        return created_receipt
+        result = {key: (ReceiptBatchStatus.DUPLICATE, receipt) for key, receipt in duplicates.items()}
+        result.update({key: (ReceiptBatchStatus.CREATED, receipt) for key, receipt in created.items()})
+        return result
@@ -1,8 +1,9 @@
 from typing import Optional
 
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 
-from database import get_session, User as UserDBModel
+from database import get_session, get_read_session, has_replicas, mark_written, unit_of_work, User as UserDBModel
 from dto import User, UserCreate
 from services import AuthService
 
@@ -10,16 +11,23 @@ from services import AuthService
 class UserRepository:
     @classmethod
     async def save(cls, user: UserCreate) -> User:
-        hashed_password = AuthService.hash_password(user["password"])
+        hashed_password = await AuthService.hash_password(user["password"])
         entity = UserDBModel(
             name=user["name"],
             login=user["login"],
             hashed_password=hashed_password,
         )
-        async with get_session() as session:
-            session.add(entity)
-            await session.commit()
+        async with unit_of_work() as uow:
+            try:
+                async with uow.savepoint() as session:
+                    session.add(entity)
+                    await session.flush()
+            except IntegrityError:
+                raise ValueError(f"User with login '{user['login']}' already exists")
+            user_id = entity.id
+        mark_written(("users", user["login"]))
         return User(
+            id=user_id,
             login=user["login"],
             name=user["name"],
             hashed_password=hashed_password,
@@ -27,12 +35,16 @@ class UserRepository:
 
     @classmethod
     async def get_by_login(cls, login: str) -> Optional[User]:
-        async with get_session() as session:
-            data = (await session.execute(
-                select(UserDBModel).where(UserDBModel.login == login)
-            )).scalars().first()
+        statement = select(UserDBModel).where(UserDBModel.login == login)
+        async with get_read_session(("users", login)) as session:
+            data = (await session.execute(statement)).scalars().first()
+        if not data and has_replicas():
+            # A freshly registered user may not have reached the replica yet.
+            async with get_session() as session:
+                data = (await session.execute(statement)).scalars().first()
         if data:
             return User(
+                id=data.id,
                 login=data.login,
                 name=data.name,
                 hashed_password=data.hashed_password,
@@ -40,9 +52,18 @@ class UserRepository:
 
     @classmethod
     async def get_id_by_login(cls, login: str) -> Optional[int]:
-        async with get_session() as session:
-            user_id = (await session.execute(
-                select(UserDBModel.id).where(UserDBModel.login == login)
-            )).scalars().first()
+        statement = select(UserDBModel.id).where(UserDBModel.login == login)
+        async with get_read_session(("users", login)) as session:
+            user_id = (await session.execute(statement)).scalars().first()
+        if user_id is None and has_replicas():
+            async with get_session() as session:
+                user_id = (await session.execute(statement)).scalars().first()
         return user_id
 
+    @classmethod
+    async def update_password_hash(cls, login: str, hashed_password: str) -> None:
+        async with get_session() as session:
+            await session.execute(
+                update(UserDBModel).where(UserDBModel.login == login).values(hashed_password=hashed_password)
+            )
+        mark_written(("users", login))
@@ -1,3 +1,4 @@
 from .user import router as users_router
 from .auth import router as auth_router
 from .receipt import router as receipt_router
+from .internal import router as internal_router
@@ -1,27 +1,47 @@
+import os
 from datetime import timedelta
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, APIRouter
 from fastapi.security import OAuth2PasswordRequestForm
 from starlette import status
+from starlette.requests import Request
 
+from middleware.rate_limit import get_client_ip
 from services import AuthService, UserService
+from services.rate_limit import RateLimiter
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Password attempts per login, client address and minute, each of which costs a password hash verification.
+# Keyed by address too, so nobody can lock a user out by guessing their password; the per-address limit of the
+# rate limiter middleware caps guesses across logins.
+LOGIN_ATTEMPTS_PER_MINUTE = float(os.environ.get("LOGIN_ATTEMPTS_PER_MINUTE", 5))
+LOGIN_ATTEMPTS_BURST = float(os.environ.get("LOGIN_ATTEMPTS_BURST", 10))
 router = APIRouter()
 
 
 @router.post("/token")
-async def get_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
-    authenticated = await UserService.authenticate(form_data.username, form_data.password)
-    if not authenticated:
+async def get_access_token(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+    retry_after = await RateLimiter.hit(
+        ("login-attempts", form_data.username, get_client_ip(request.scope, request.headers)),
+        LOGIN_ATTEMPTS_PER_MINUTE / 60,
+        LOGIN_ATTEMPTS_BURST,
+    )
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(retry_after)},
+        )
+    user = await UserService.authenticate(form_data.username, form_data.password)
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect login or password",
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = AuthService.create_access_token(
-        data={"login": form_data.username},
+        data={"login": user["login"], "user_id": user["id"]},
         expires_delta=access_token_expires,
     )
     return {"access_token": access_token}
@@ -29,5 +49,5 @@ async def get_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depen
 
 @router.get("/verify-token/")
 async def verify_token(token: str):
-    if AuthService.authenticate(token):
+    if AuthService.verify_token(token):
         return {"message": "Token is valid"}
@@ -0,0 +1,51 @@
+import hmac
+import os
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from database import get_pool_metrics, get_replica_pool_metrics
+from repositories import ProductRepository
+from services import AuthService, UserService, ReceiptService
+from services.metrics import Metrics
+
+# Bearer token for the pool, cache and metrics endpoints; they are closed while it is unset.
+INTERNAL_API_TOKEN = os.environ.get("INTERNAL_API_TOKEN", "")
+
+router = APIRouter(include_in_schema=False)
+
+
+def require_internal_token(authorization: str = Header(default="")) -> None:
+    scheme, _, token = authorization.partition(" ")
+    if not INTERNAL_API_TOKEN or scheme.lower() != "bearer" or not hmac.compare_digest(token, INTERNAL_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@router.get("/health")
+async def get_health():
+    return {"status": "ok"}
+
+
+@router.get("/pool", dependencies=[Depends(require_internal_token)])
+async def get_pool_stats():
+    return {
+        "database": get_pool_metrics(),
+        "replicas": get_replica_pool_metrics(),
+        "password_hasher": AuthService.password_hasher.metrics(),
+        "write_behind": ReceiptService.write_behind.metrics() if ReceiptService.write_behind is not None else None,
+    }
+
+
+@router.get("/caches", dependencies=[Depends(require_internal_token)])
+async def get_cache_stats():
+    return {
+        "product_catalog": ProductRepository.catalog_cache.stats(),
+        "public_receipts": ReceiptService.public_receipt_cache.stats(),
+        "receipt_counts": ReceiptService.count_cache.stats(),
+        "user_ids": UserService.user_id_cache.stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_internal_token)])
+async def get_metrics():
+    return PlainTextResponse(Metrics.render(), media_type="text/plain; version=0.0.4")
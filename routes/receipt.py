@@ -1,25 +1,46 @@
-from typing import List, Optional
+import json
+import uuid
+from decimal import Decimal
+from typing import List, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field, model_validator
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel, Field, ValidationError, model_validator
 from starlette import status
 from starlette.requests import Request
-from starlette.responses import PlainTextResponse
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
 
-from dto import ReceiptSwaggerFilters
+from dto import (
+    ReceiptSwaggerFilters, ReceiptAttributeFilters, ReceiptExportFormat, ReceiptStatsGroupBy, ReceiptRenderFormat,
+)
 from dto.filters import ReceiptFilters
 from dto.product import ProductAggregated
-from dto.receipt import PaymentType, ReceiptCreate, Payment
-from services import AuthService, UserService, ReceiptService
+from dto.receipt import PaymentType, ReceiptCreate, Payment, ReceiptBatchItem, ReceiptBatchResult, ReceiptBatchStatus
+from dto.user import Principal
+from routes.responses import ReceiptJSONResponse
+from services import UserService, ReceiptService
+from services.rendering import get_renderer
+from services.write_behind import WriteBehindBacklogFull
+
+RECEIPT_BATCH_MAX_SIZE = 5000
+RECEIPT_SEARCH_MAX_LIMIT = 100
+RECEIPT_WRITE_BEHIND_RETRY_AFTER = 1
+# Every width is a separate cache entry, so only a small range of them can be requested.
+PUBLIC_RECEIPT_MIN_LINE_WIDTH = 16
+PUBLIC_RECEIPT_MAX_LINE_WIDTH = 80
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+EXPORT_MEDIA_TYPES = {
+    ReceiptExportFormat.NDJSON: NDJSON_MEDIA_TYPE,
+    ReceiptExportFormat.CSV: "text/csv",
+}
 
 router = APIRouter()
 
 
 class ProductCreateModel(BaseModel):
     name: str
-    price: float = Field(gt=0)
+    price: Decimal = Field(gt=0, decimal_places=2)
     quantity: Optional[int] = Field(gt=0, default=None)
-    weight: Optional[float] = Field(gt=0, default=None)
+    weight: Optional[Decimal] = Field(gt=0, decimal_places=3, default=None)
 
     def to_dto(self):
         return ProductAggregated(
@@ -39,7 +60,7 @@ class ProductCreateModel(BaseModel):
 
 class PaymentModel(BaseModel):
     type: PaymentType
-    amount: float = Field(gt=0)
+    amount: Decimal = Field(gt=0, decimal_places=2)
 
     def to_dto(self):
         return Payment(
@@ -55,37 +76,104 @@ class ReceiptCreateModel(BaseModel):
     def to_dto(self):
         return ReceiptCreate(
             payment=self.payment.to_dto(),
-            products=[p.to_dto() for p in self.products]
+            products=[p.to_dto() for p in self.products],
+            total=None,
+            rest=None,
+        )
+
+
+class ReceiptBatchItemModel(ReceiptCreateModel):
+    idempotency_key: str = Field(min_length=1, max_length=128)
+
+    def to_dto(self):
+        return ReceiptBatchItem(
+            idempotency_key=self.idempotency_key,
+            receipt=super().to_dto(),
+        )
+
+
+def _parse_batch(body: bytes, content_type: str) -> List[Union[ReceiptBatchItemModel, ReceiptBatchResult]]:
+    try:
+        if content_type.startswith(NDJSON_MEDIA_TYPE):
+            raw_items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            raw_items = json.loads(body)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to parse the batch: {str(e)}"
+        )
+    if not isinstance(raw_items, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch must be a JSON array or NDJSON stream of receipts"
         )
+    if len(raw_items) > RECEIPT_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch can contain at most {RECEIPT_BATCH_MAX_SIZE} receipts"
+        )
+
+    items = []
+    for raw_item in raw_items:
+        try:
+            items.append(ReceiptBatchItemModel.model_validate(raw_item))
+        except ValidationError as e:
+            idempotency_key = raw_item.get("idempotency_key") if isinstance(raw_item, dict) else None
+            items.append(ReceiptBatchResult(
+                idempotency_key=idempotency_key if isinstance(idempotency_key, str) else None,
+                status=ReceiptBatchStatus.ERROR,
+                receipt=None,
+                detail=str(e),
+            ))
+    return items
 
 
-@router.post("/", dependencies=[Depends(AuthService.authenticate)])
-async def create_receipt(receipt: ReceiptCreateModel, request: Request):
-    token = request.headers["authorization"].replace("Bearer ", "")
-    payload = AuthService.authenticate(token)
-    user_id = await UserService.get_id_by_login(payload["login"])
+@router.post("/", response_class=ReceiptJSONResponse)
+async def create_receipt(receipt: ReceiptCreateModel, principal: Principal = Depends(UserService.get_principal)):
     dto = receipt.to_dto()
     try:
-        receipt = await ReceiptService.create(dto, user_id)
-        return {"data": receipt}
+        receipt = await ReceiptService.create(dto, principal["user_id"])
+        return ReceiptJSONResponse({"data": receipt})
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Failed to save the receipt: {str(e)}"
         )
+    except WriteBehindBacklogFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many receipts are waiting to be saved, retry later",
+            headers={"Retry-After": str(RECEIPT_WRITE_BEHIND_RETRY_AFTER)},
+        )
+
 
+@router.post("/batch", response_class=ReceiptJSONResponse)
+async def create_receipts_batch(request: Request, principal: Principal = Depends(UserService.get_principal)):
+    items = _parse_batch(await request.body(), request.headers.get("content-type", ""))
 
-@router.get("/", dependencies=[Depends(AuthService.authenticate)])
-async def get_receipts(request: Request, filters: ReceiptSwaggerFilters = Depends()):
-    token = request.headers["authorization"].replace("Bearer ", "")
-    payload = AuthService.authenticate(token)
-    user_id = await UserService.get_id_by_login(payload["login"])
+    valid_items = [item for item in items if isinstance(item, ReceiptBatchItemModel)]
+    saved = iter(await ReceiptService.create_batch([item.to_dto() for item in valid_items], principal["user_id"]))
+    results = [next(saved) if isinstance(item, ReceiptBatchItemModel) else item for item in items]
+    return ReceiptJSONResponse({"data": results, "count": len(results)})
+
+
+@router.get("/", response_class=ReceiptJSONResponse)
+async def get_receipts(
+        principal: Principal = Depends(UserService.get_principal),
+        filters: ReceiptSwaggerFilters = Depends(),
+):
     try:
-        receipts = await ReceiptService.get(ReceiptFilters(
+        receipt_filters = ReceiptFilters(
             **filters.dict(exclude_unset=True),
-            user_id=user_id,
-        ))
-        return {"data": receipts, "count": len(receipts)}
+            user_id=principal["user_id"],
+        )
+        receipts = await ReceiptService.get(receipt_filters)
+        next_cursor, previous_cursor = ReceiptService.get_cursors(receipts, receipt_filters)
+        response = {"data": receipts, "count": len(receipts), "next": next_cursor, "previous": previous_cursor}
+        if receipt_filters.count_mode is not None:
+            response["total_count"] = await ReceiptService.count(receipt_filters, receipt_filters.count_mode)
+        return ReceiptJSONResponse(response)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -93,12 +181,113 @@ async def get_receipts(request: Request, filters: ReceiptSwaggerFilters = Depend
         )
 
 
+@router.get("/export")
+async def export_receipts(
+        principal: Principal = Depends(UserService.get_principal),
+        export_format: ReceiptExportFormat = Query(ReceiptExportFormat.NDJSON, alias="format"),
+        after: Optional[str] = None,
+        filters: ReceiptAttributeFilters = Depends(),
+):
+    try:
+        receipt_filters = ReceiptFilters(
+            **filters.dict(exclude_unset=True),
+            user_id=principal["user_id"],
+            after=after,
+            limit=None,
+            offset=None,
+        )
+        if after is not None:
+            receipt_filters.decode_cursor(after)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to export receipts: {str(e)}"
+        )
+
+    return StreamingResponse(
+        ReceiptService.export(receipt_filters, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="receipts.{export_format.value}"'},
+    )
+
+
+@router.get("/stats", response_class=ReceiptJSONResponse)
+async def get_receipt_stats(
+        principal: Principal = Depends(UserService.get_principal),
+        group_by: ReceiptStatsGroupBy = ReceiptStatsGroupBy.DAY,
+        limit: Optional[int] = Query(default=None, gt=0),
+        filters: ReceiptAttributeFilters = Depends(),
+):
+    try:
+        stats = await ReceiptService.get_stats(
+            ReceiptFilters(
+                **filters.dict(exclude_unset=True),
+                user_id=principal["user_id"],
+                limit=limit,
+                offset=None,
+            ),
+            group_by,
+        )
+        return ReceiptJSONResponse({"data": stats, "count": len(stats)})
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to fetch receipt stats: {str(e)}"
+        )
+
+
+@router.get("/search", response_class=ReceiptJSONResponse)
+async def search_receipts(
+        q: str = Query(min_length=1, max_length=200),
+        principal: Principal = Depends(UserService.get_principal),
+        limit: int = Query(default=20, gt=0, le=RECEIPT_SEARCH_MAX_LIMIT),
+        offset: int = Query(default=0, ge=0),
+        filters: ReceiptAttributeFilters = Depends(),
+):
+    results = await ReceiptService.search(
+        q,
+        ReceiptFilters(
+            **filters.dict(exclude_unset=True),
+            user_id=principal["user_id"],
+            limit=limit,
+            offset=offset,
+        ),
+    )
+    return ReceiptJSONResponse({"data": results, "count": len(results)})
+
+
+@router.get("/search/autocomplete", response_class=ReceiptJSONResponse)
+async def autocomplete_product_names(
+        prefix: str = Query(min_length=1, max_length=200),
+        principal: Principal = Depends(UserService.get_principal),
+        limit: int = Query(default=10, gt=0, le=RECEIPT_SEARCH_MAX_LIMIT),
+):
+    names = await ReceiptService.suggest_product_names(prefix, principal["user_id"], limit)
+    return ReceiptJSONResponse({"data": names, "count": len(names)})
+
+
 @router.get("/{public_token}", response_class=PlainTextResponse)
-async def get_receipt_by_token(public_token: str, line_width: int = 32):
-    receipt = (await ReceiptService.get(ReceiptFilters(public_token=public_token)))[0]
-    if not receipt:
+async def get_receipt_by_token(
+        public_token: str,
+        request: Request,
+        line_width: int = Query(32, ge=PUBLIC_RECEIPT_MIN_LINE_WIDTH, le=PUBLIC_RECEIPT_MAX_LINE_WIDTH),
+        render_format: ReceiptRenderFormat = Query(ReceiptRenderFormat.TEXT, alias="format"),
+):
+    # Tokens are uuid4 strings. Any other value is rejected up front, while a well-formed unknown token that
+    # arrives with a matching If-None-Match still gets a 304, since its content is never looked up.
+    try:
+        uuid.UUID(public_token)
+    except ValueError:
         raise HTTPException(status_code=404, detail="Receipt not found")
 
-    return ReceiptService.format_receipt(receipt, line_width=line_width)
+    etag = ReceiptService.public_receipt_etag(public_token, line_width, render_format)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
+    content = await ReceiptService.render_public_receipt(public_token, line_width, render_format)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Receipt not found")
 
+    return Response(content, media_type=get_renderer(render_format, line_width).media_type, headers=headers)
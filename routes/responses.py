@@ -0,0 +1,10 @@
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+from services.serialization import dumps
+
+
+class ReceiptJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -18,4 +18,7 @@ async def register_user(user: UserModel):
     does_user_exist = await UserService.does_exist_by_login(login=user.login)
     if does_user_exist:
         raise HTTPException(status_code=400, detail="Username already registered")
-    return await UserService.create(UserCreate(login=user.login, name=user.name, password=user.password))
+    try:
+        return await UserService.create(UserCreate(login=user.login, name=user.name, password=user.password))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,41 @@
+"""Production entry point.
+
+    python -m database.migrations && python server.py
+
+Runs one uvicorn worker per available CPU core unless WEB_CONCURRENCY says
+otherwise. uvloop and httptools are used when installed.
+"""
+import os
+
+import uvicorn
+
+
+def get_worker_count() -> int:
+    if os.environ.get("WEB_CONCURRENCY"):
+        return max(int(os.environ["WEB_CONCURRENCY"]), 1)
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def main():
+    workers = get_worker_count()
+    # Workers read this to split DB_MAX_CONNECTIONS between themselves.
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    os.environ.setdefault("MIGRATE_ON_STARTUP", "false")
+    uvicorn.run(
+        "main:create_app",
+        factory=True,
+        host=os.environ.get("HOST", "0.0.0.0"),
+        port=int(os.environ.get("PORT", 8000)),
+        workers=workers,
+        loop="auto",
+        http="auto",
+        proxy_headers=True,
+        access_log=os.environ.get("ACCESS_LOG", "false").lower() in ("1", "true", "yes"),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
 from .auth import AuthService
+from .cache import TTLCache, CacheBackend, InMemoryCacheBackend
 from .user import UserService
 from .receipt import ReceiptService
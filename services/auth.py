@@ -1,30 +1,37 @@
 import os
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 
 import jwt
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
+from starlette.requests import Request
 
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-)
+from services.password import PasswordHasher
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
 SECRET_KEY = os.environ.get("SECRET_KEY", "SECRET_KEY")
 ALGORITHM = os.environ.get("ALGORITHM", "ALGORITHM")
+# Request state key of the decoded bearer token, None when it is invalid.
+TOKEN_PAYLOAD_STATE_KEY = "token_payload"
 
 
 class AuthService:
+    password_hasher = PasswordHasher()
+
+    @classmethod
+    async def verify_password(cls, password: str, hashed_password: str) -> bool:
+        verified, _ = await cls.password_hasher.verify_and_update(password, hashed_password)
+        return verified
+
     @classmethod
-    def verify_password(cls, password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(password, hashed_password)
+    async def verify_and_update_password(cls, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        return await cls.password_hasher.verify_and_update(password, hashed_password)
 
     @classmethod
-    def hash_password(cls, password: str) -> str:
-        return pwd_context.hash(password)
+    async def hash_password(cls, password: str) -> str:
+        return await cls.password_hasher.hash(password)
 
     @classmethod
     def create_access_token(cls, data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -38,13 +45,25 @@ class AuthService:
         return encoded_jwt
 
     @classmethod
-    def authenticate(cls, token: str = Depends(oauth2_scheme)) -> dict:
-        error_403 = HTTPException(status_code=403, detail="Token is invalid or expired")
+    def decode_token(cls, token: str) -> Optional[dict]:
         try:
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            login: str = payload.get("login")
-            if login is None:
-                raise error_403
-            return payload
         except jwt.exceptions.PyJWTError:
-            raise error_403
+            return None
+        return payload if payload.get("login") is not None else None
+
+    @classmethod
+    def verify_token(cls, token: str) -> dict:
+        payload = cls.decode_token(token)
+        if payload is None:
+            raise HTTPException(status_code=403, detail="Token is invalid or expired")
+        return payload
+
+    @classmethod
+    def authenticate(cls, request: Request, token: str = Depends(oauth2_scheme)) -> dict:
+        # The rate limiter decodes the bearer token of the request before it gets here, and leaves the result.
+        state = request.scope.get("state", {})
+        payload = state[TOKEN_PAYLOAD_STATE_KEY] if TOKEN_PAYLOAD_STATE_KEY in state else cls.decode_token(token)
+        if payload is None:
+            raise HTTPException(status_code=403, detail="Token is invalid or expired")
+        return payload
@@ -0,0 +1,101 @@
+import bisect
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from database import QueryTotals, get_pool_metrics
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name: str, description: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[Tuple[str, ...], List[int]] = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._sums: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        self._counts[labels][bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.description}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts in sorted(self._counts.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f'{self.name}_bucket{{{label_text},le="{le}"}} {cumulative}'
+            yield f"{self.name}_sum{{{label_text}}} {self._sums[labels]}"
+            yield f"{self.name}_count{{{label_text}}} {cumulative}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_counter(name: str, description: str, value: float, kind: str = "counter") -> Iterable[str]:
+    yield f"# HELP {name} {description}"
+    yield f"# TYPE {name} {kind}"
+    yield f"{name} {value}"
+
+
+def render_labeled_counter(
+        name: str, description: str, label_names: Sequence[str], values: Dict[Tuple[str, ...], float],
+) -> Iterable[str]:
+    yield f"# HELP {name} {description}"
+    yield f"# TYPE {name} counter"
+    for labels, value in sorted(values.items()):
+        label_text = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in zip(label_names, labels))
+        yield f"{name}{{{label_text}}} {value}"
+
+
+class Metrics:
+    request_duration = Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route.",
+        ("method", "route", "status"),
+        LATENCY_BUCKETS,
+    )
+    request_db_queries = Histogram(
+        "http_request_db_queries",
+        "Database statements per sampled request by route.",
+        ("method", "route"),
+        QUERY_COUNT_BUCKETS,
+    )
+    request_db_duration = Histogram(
+        "http_request_db_duration_seconds",
+        "Database time per sampled request by route.",
+        ("method", "route"),
+        LATENCY_BUCKETS,
+    )
+    # Keyed by (reason, rule) of the rate limiter and the load shedder.
+    rejected_requests: Dict[Tuple[str, ...], int] = defaultdict(int)
+    requests_in_flight = 0
+
+    @classmethod
+    def render(cls) -> str:
+        pool = get_pool_metrics()
+        lines = [
+            *cls.request_duration.render(),
+            *cls.request_db_queries.render(),
+            *cls.request_db_duration.render(),
+            *render_labeled_counter(
+                "http_requests_rejected_total", "Requests rejected before reaching a route.", ("reason", "rule"),
+                cls.rejected_requests,
+            ),
+            *render_counter("http_requests_in_flight", "Requests being handled.", cls.requests_in_flight, "gauge"),
+            *render_counter("db_queries_total", "Database statements executed.", QueryTotals.count),
+            *render_counter("db_query_seconds_total", "Time spent in database statements.", QueryTotals.duration),
+            *render_counter("db_pool_checkouts_total", "Connection pool checkouts.", pool["checkouts_total"]),
+            *render_counter("db_pool_timeouts_total", "Connection pool checkout timeouts.", pool["timeouts_total"]),
+            *render_counter(
+                "db_pool_wait_seconds_total", "Time spent waiting for a pooled connection.", pool["wait_seconds_total"],
+            ),
+        ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,52 @@
+import math
+import os
+import time
+from typing import Hashable, Optional
+
+from services.cache import TTLCache
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Least recently used buckets beyond this are dropped, which refills them.
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", 100_000))
+
+
+class RateLimitStore:
+    # Takes `cost` tokens from the bucket and returns 0, or the seconds until enough tokens are available.
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        raise NotImplementedError
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self._buckets = TTLCache(maxsize=maxsize)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        if tokens >= cost:
+            self._buckets.set(key, (tokens - cost, now))
+            return 0.0
+        self._buckets.set(key, (tokens, now))
+        return (cost - tokens) / rate
+
+    def stats(self) -> dict:
+        return self._buckets.stats()
+
+
+class RateLimiter:
+    # Per-process buckets by default; set a shared store so limits hold across workers and hosts.
+    store: RateLimitStore = InMemoryRateLimitStore()
+    enabled: bool = RATE_LIMIT_ENABLED
+
+    @classmethod
+    def set_store(cls, store: RateLimitStore) -> None:
+        cls.store = store
+
+    @classmethod
+    async def hit(cls, key: Hashable, rate: float, burst: float) -> Optional[int]:
+        # Returns None when the request is allowed, otherwise the Retry-After value in whole seconds.
+        if not cls.enabled:
+            return None
+        retry_after = await cls.store.take(str(key), rate, burst)
+        return max(math.ceil(retry_after), 1) if retry_after else None
@@ -1,82 +1,279 @@
-from typing import List, Optional
+import csv
+import io
+import os
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 
-from dto import ReceiptCreate, Receipt, ReceiptFilters
-from repositories import ReceiptRepository
+from database import after_commit
+from dto import (
+    ReceiptCreate, Receipt, ReceiptFilters, Payment, PendingReceipt, ProductAggregated, ReceiptBatchItem,
+    ReceiptBatchResult, ReceiptBatchStatus, ReceiptExportFormat, ReceiptStats, ReceiptStatsGroupBy, ReceiptCountMode,
+    ReceiptRenderFormat, ReceiptSummary, ReceiptSearchResult,
+)
+from dto.money import to_minor, from_minor, line_total_minor
+from repositories import ProductRepository, ReceiptRepository
+from services.cache import TTLCache, CacheBackend
+from services.rendering import get_renderer
+from services.serialization import dumps
+from services.write_behind import ReceiptWriteBehind
+
+PUBLIC_RECEIPT_CACHE_SIZE = int(os.environ.get("PUBLIC_RECEIPT_CACHE_SIZE", 10_000))
+PUBLIC_RECEIPT_CACHE_TTL = float(os.environ.get("PUBLIC_RECEIPT_CACHE_TTL", 24 * 60 * 60))
+PUBLIC_RECEIPT_DEFAULT_LINE_WIDTH = 32
+RECEIPT_COUNT_CACHE_SIZE = int(os.environ.get("RECEIPT_COUNT_CACHE_SIZE", 10_000))
+RECEIPT_COUNT_CACHE_TTL = float(os.environ.get("RECEIPT_COUNT_CACHE_TTL", 5))
+# Filter fields that only shape the page, so every page of the same filters shares one cached count.
+RECEIPT_COUNT_CACHE_KEY_EXCLUDE = {"limit", "offset", "after", "before", "count_mode", "fields", "include_products"}
+EXPORT_CHUNK_SIZE = 500
+EXPORT_CSV_HEADER = [
+    "receipt_id", "created_at", "payment_type", "amount_paid", "total", "rest", "public_token",
+    "product_name", "product_price", "product_quantity", "product_weight", "product_total",
+]
 
 
 class ReceiptService:
+    public_receipt_cache = TTLCache(maxsize=PUBLIC_RECEIPT_CACHE_SIZE, ttl=PUBLIC_RECEIPT_CACHE_TTL)
+    public_receipt_backend: Optional[CacheBackend] = None
+    count_cache = TTLCache(maxsize=RECEIPT_COUNT_CACHE_SIZE, ttl=RECEIPT_COUNT_CACHE_TTL)
+    write_behind: Optional[ReceiptWriteBehind] = None
+
     @classmethod
-    def _validate(cls, receipt: ReceiptCreate) -> None:
-        amount_paid = receipt["payment"]["amount"]
-        total = sum([p["price"] * p.get("quantity", 1) for p in receipt["products"]])
-        if amount_paid < total:
-            raise ValueError("Not enough money. Total is bigger than amount paid")
+    def _calculate(cls, receipt: ReceiptCreate) -> None:
+        total_minor = 0
+        for product in receipt["products"]:
+            product_total_minor = line_total_minor(to_minor(product["price"]), product["quantity"], product["weight"])
+            product["total"] = from_minor(product_total_minor)
+            total_minor += product_total_minor
+        receipt["total"] = from_minor(total_minor)
+        receipt["rest"] = from_minor(to_minor(receipt["payment"]["amount"]) - total_minor)
 
     @classmethod
-    def _format_number(cls, number: float) -> str:
-        return f"{number:,.2f}".replace(",", " ")
+    def _validate(cls, receipt: ReceiptCreate) -> None:
+        cls._calculate(receipt)
+        if receipt["rest"] < 0:
+            raise ValueError("Not enough money. Total is bigger than amount paid")
 
     @classmethod
     async def create(cls, receipt: ReceiptCreate, user_id: int) -> Receipt:
         cls._validate(receipt)
-        return await ReceiptRepository.save(receipt, user_id)
+        if cls.write_behind is not None:
+            # Looked up before the receipt is queued, the response shows the prices it is stored with.
+            prices = await ProductRepository.get_prices(receipt["products"])
+            created = cls._from_pending(await cls.write_behind.submit(receipt, user_id), prices)
+        else:
+            created = await ReceiptRepository.save(receipt, user_id)
+        content = get_renderer(ReceiptRenderFormat.TEXT, PUBLIC_RECEIPT_DEFAULT_LINE_WIDTH).render(created)
+        # Cached only once the receipt is committed, so a rolled back receipt is never served.
+        await after_commit(lambda: cls._cache_public_receipt(
+            created["public_token"], PUBLIC_RECEIPT_DEFAULT_LINE_WIDTH, ReceiptRenderFormat.TEXT, content,
+        ))
+        return created
+
+    @classmethod
+    def _from_pending(cls, pending: PendingReceipt, prices: Dict[str, Decimal]) -> Receipt:
+        receipt = pending["receipt"]
+        return Receipt(
+            id=pending["id"],
+            created_at=pending["created_at"],
+            payment=Payment(type=receipt["payment"]["type"], amount=receipt["payment"]["amount"]),
+            products=[
+                ProductAggregated(**{**product, "price": prices[product["name"]]}) for product in receipt["products"]
+            ],
+            total=receipt["total"],
+            rest=receipt["rest"],
+            public_token=pending["public_token"],
+        )
+
+    @classmethod
+    async def start_write_behind(cls, write_behind: Optional[ReceiptWriteBehind] = None) -> None:
+        # Receipts are acknowledged once they are in the local log and committed to Postgres in the background.
+        write_behind = write_behind or ReceiptWriteBehind()
+        try:
+            await write_behind.start()
+        except BaseException:
+            await write_behind.stop()
+            raise
+        cls.write_behind = write_behind
+
+    @classmethod
+    async def stop_write_behind(cls) -> None:
+        if cls.write_behind is not None:
+            await cls.write_behind.stop()
+            cls.write_behind = None
+
+    @classmethod
+    def set_public_receipt_backend(cls, backend: Optional[CacheBackend]) -> None:
+        cls.public_receipt_backend = backend
+
+    @classmethod
+    def public_receipt_etag(cls, public_token: str, line_width: int, render_format: ReceiptRenderFormat) -> str:
+        # Receipts are immutable, so the token and layout fully identify the rendered output.
+        return f'"{public_token}-{line_width}-{render_format.value}"'
+
+    @classmethod
+    async def _cache_public_receipt(
+            cls,
+            public_token: str,
+            line_width: int,
+            render_format: ReceiptRenderFormat,
+            content: bytes,
+    ) -> None:
+        cls.public_receipt_cache.set((public_token, line_width, render_format), content)
+        if cls.public_receipt_backend is not None:
+            await cls.public_receipt_backend.set(
+                f"receipt:{public_token}:{line_width}:{render_format.value}", content, ttl=PUBLIC_RECEIPT_CACHE_TTL
+            )
+
+    @classmethod
+    async def render_public_receipt(
+            cls,
+            public_token: str,
+            line_width: int,
+            render_format: ReceiptRenderFormat = ReceiptRenderFormat.TEXT,
+    ) -> Optional[bytes]:
+        content = cls.public_receipt_cache.get((public_token, line_width, render_format))
+        if content is not None:
+            return content
+
+        if cls.public_receipt_backend is not None:
+            content = await cls.public_receipt_backend.get(
+                f"receipt:{public_token}:{line_width}:{render_format.value}"
+            )
+            if content is not None:
+                cls.public_receipt_cache.set((public_token, line_width, render_format), content)
+                return content
+
+        receipts = await ReceiptRepository.get(ReceiptFilters(public_token=public_token, limit=1))
+        if not receipts:
+            return None
+        content = get_renderer(render_format, line_width).render(receipts[0])
+        await cls._cache_public_receipt(public_token, line_width, render_format, content)
+        return content
+
+    @classmethod
+    async def create_batch(cls, items: List[ReceiptBatchItem], user_id: int) -> List[ReceiptBatchResult]:
+        errors = {}
+        valid_items = []
+        seen_keys = set()
+        for index, item in enumerate(items):
+            try:
+                if item["idempotency_key"] in seen_keys:
+                    raise ValueError("Idempotency key is repeated in the batch")
+                seen_keys.add(item["idempotency_key"])
+                cls._validate(item["receipt"])
+            except ValueError as e:
+                errors[index] = str(e)
+                continue
+            valid_items.append(item)
+
+        saved = await ReceiptRepository.save_batch(valid_items, user_id)
+
+        results = []
+        for index, item in enumerate(items):
+            if index in errors:
+                results.append(ReceiptBatchResult(
+                    idempotency_key=item["idempotency_key"],
+                    status=ReceiptBatchStatus.ERROR,
+                    receipt=None,
+                    detail=errors[index],
+                ))
+                continue
+            status, receipt = saved[item["idempotency_key"]]
+            results.append(ReceiptBatchResult(
+                idempotency_key=item["idempotency_key"],
+                status=status,
+                receipt=receipt,
+                detail=None,
+            ))
+        return results
 
     @classmethod
-    async def get(cls, filters: Optional[ReceiptFilters]) -> List[Receipt]:
+    async def get(cls, filters: ReceiptFilters) -> Union[List[Receipt], List[ReceiptSummary]]:
+        fields = filters.get_summary_fields()
+        if fields is not None:
+            return await ReceiptRepository.get_summaries(filters, fields)
         return await ReceiptRepository.get(filters)
 
     @classmethod
-    def format_receipt(cls, receipt: dict, line_width: int) -> str:
-        seller = "ФОП Джонсонюк Борис"
-        header = seller.center(line_width)
-        separator = "=" * line_width
-        footer = "Дякуємо за покупку!".center(line_width)
-        date_time = receipt["created_at"].strftime("%d.%m.%Y %H:%M").center(line_width)
+    def _export_ndjson(cls, receipt: Receipt) -> str:
+        return dumps(receipt).decode() + "\n"
 
-        product_lines = []
+    @classmethod
+    def _export_csv(cls, receipt: Receipt) -> str:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        head = [
+            receipt["id"],
+            receipt["created_at"].isoformat(),
+            receipt["payment"]["type"].value,
+            receipt["payment"]["amount"],
+            receipt["total"],
+            receipt["rest"],
+            receipt["public_token"],
+        ]
+        if not receipt["products"]:
+            writer.writerow(head + [None] * 5)
         for product in receipt["products"]:
-            quantity_price = (
-                f"{cls._format_number(product['quantity'])} x {cls._format_number(product['price'])}"
-            )
-            product_total = cls._format_number(product["total"])
-            product_name = product["name"]
-
-            product_lines.append(quantity_price)
-
-            if len(product_name) + len(product_total) + 1 > line_width:
-                chunks = [
-                    product_name[i:i + (line_width - 1)]
-                    for i in range(0, len(product_name), line_width - 1)
-                ]
-
-                product_lines.extend(chunks[:-1])
-
-                product_lines.append(
-                    f"{chunks[-1].ljust(line_width - len(product_total))}{product_total}"
-                )
-            else:
-                product_lines.append(
-                    f"{product_name.ljust(line_width - len(product_total))}{product_total}"
-                )
-
-        total = float(receipt["total"])
-        amount_paid = float(receipt["payment"]["amount"])
-        rest = float(receipt["rest"])
-
-        total_line = f"СУМА".ljust(line_width // 2) + cls._format_number(total).rjust(line_width // 2)
-        payment_line = f"{receipt['payment']['type']}".ljust(line_width // 2) + cls._format_number(amount_paid).rjust(
-            line_width // 2)
-        change_line = f"Решта".ljust(line_width // 2) + cls._format_number(rest).rjust(line_width // 2)
-
-        return "\n".join([
-            header,
-            separator,
-            *product_lines,
-            separator,
-            total_line,
-            payment_line,
-            change_line,
-            separator,
-            date_time,
-            footer,
-        ])
+            writer.writerow(head + [
+                product["name"], product["price"], product["quantity"], product["weight"], product["total"],
+            ])
+        return buffer.getvalue()
+
+    @classmethod
+    async def export(cls, filters: ReceiptFilters, export_format: ReceiptExportFormat) -> AsyncIterator[str]:
+        if export_format == ReceiptExportFormat.CSV:
+            render = cls._export_csv
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(EXPORT_CSV_HEADER)
+            yield buffer.getvalue()
+        else:
+            render = cls._export_ndjson
+
+        chunk = []
+        async for receipt in ReceiptRepository.stream(filters):
+            chunk.append(render(receipt))
+            if len(chunk) >= EXPORT_CHUNK_SIZE:
+                yield "".join(chunk)
+                chunk = []
+        if chunk:
+            yield "".join(chunk)
+
+    @classmethod
+    async def count(cls, filters: ReceiptFilters, mode: ReceiptCountMode) -> int:
+        key = (mode, filters.model_dump_json(exclude=RECEIPT_COUNT_CACHE_KEY_EXCLUDE))
+        total_count = cls.count_cache.get(key)
+        if total_count is None:
+            total_count = await ReceiptRepository.count(filters, mode)
+            cls.count_cache.set(key, total_count)
+        return total_count
+
+    @classmethod
+    async def search(cls, query: str, filters: ReceiptFilters) -> List[ReceiptSearchResult]:
+        query = query.strip()
+        return await ReceiptRepository.search(query, filters) if query else []
+
+    @classmethod
+    async def suggest_product_names(cls, prefix: str, user_id: int, limit: int) -> List[str]:
+        prefix = prefix.strip()
+        return await ReceiptRepository.suggest_product_names(prefix, user_id, limit) if prefix else []
+
+    @classmethod
+    async def get_stats(cls, filters: ReceiptFilters, group_by: ReceiptStatsGroupBy) -> List[ReceiptStats]:
+        return await ReceiptRepository.get_stats(filters, group_by)
+
+    @classmethod
+    def get_cursors(cls, receipts: List[Receipt], filters: ReceiptFilters) -> Tuple[Optional[str], Optional[str]]:
+        if not receipts:
+            return None, None
+        is_full_page = filters.limit is not None and len(receipts) == filters.limit
+        if filters.before is not None:
+            has_next, has_previous = True, is_full_page
+        else:
+            has_next, has_previous = is_full_page, filters.after is not None or bool(filters.offset)
+        next_cursor = filters.encode_cursor(receipts[-1]["id"]) if has_next else None
+        previous_cursor = filters.encode_cursor(receipts[0]["id"]) if has_previous else None
+        return next_cursor, previous_cursor
+
+    @classmethod
+    def format_receipt(cls, receipt: dict, line_width: int) -> str:
+        return get_renderer(ReceiptRenderFormat.TEXT, line_width).render_text(receipt)
@@ -0,0 +1,4 @@
+from .layout import ReceiptLayout, get_layout, display_width
+from .renderers import (
+    ReceiptRenderer, TextRenderer, HTMLRenderer, ESCPOSRenderer, QRPayloadRenderer, get_renderer, qr_payload,
+)
@@ -0,0 +1,114 @@
+import unicodedata
+from decimal import Decimal
+from functools import lru_cache
+from typing import Iterator, List
+
+from dto import PaymentType, ProductAggregated, Receipt
+
+SELLER = "ФОП Джонсонюк Борис"
+FOOTER = "Дякуємо за покупку!"
+TOTAL_LABEL = "СУМА"
+REST_LABEL = "Решта"
+
+
+@lru_cache(maxsize=65536)
+def display_width(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    width = 0
+    for char in text:
+        if unicodedata.combining(char):
+            continue
+        width += 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+    return width
+
+
+def ljust(text: str, width: int) -> str:
+    return text + " " * max(width - display_width(text), 0)
+
+
+def rjust(text: str, width: int) -> str:
+    return " " * max(width - display_width(text), 0) + text
+
+
+def center(text: str, width: int) -> str:
+    margin = width - display_width(text)
+    if margin <= 0:
+        return text
+    # Same split as str.center, so narrow-glyph output is unchanged.
+    left = margin // 2 + (margin & width & 1)
+    return " " * left + text + " " * (margin - left)
+
+
+def split_by_width(text: str, width: int) -> List[str]:
+    chunks = []
+    chunk = ""
+    chunk_width = 0
+    for char in text:
+        char_width = display_width(char)
+        if chunk and chunk_width + char_width > width:
+            chunks.append(chunk)
+            chunk, chunk_width = "", 0
+        chunk += char
+        chunk_width += char_width
+    chunks.append(chunk)
+    return chunks
+
+
+def format_number(number: Decimal) -> str:
+    return f"{number:,.2f}".replace(",", " ")
+
+
+class ReceiptLayout:
+    def __init__(self, line_width: int):
+        self.line_width = line_width
+        self.half_width = line_width // 2
+        self.header = center(SELLER, line_width)
+        self.separator = "=" * line_width
+        self.footer = center(FOOTER, line_width)
+        self.total_label = ljust(TOTAL_LABEL, self.half_width)
+        self.rest_label = ljust(REST_LABEL, self.half_width)
+        self.payment_labels = {
+            payment_type: ljust(payment_type.value, self.half_width) for payment_type in PaymentType
+        }
+
+    def product_lines(self, product: ProductAggregated) -> Iterator[str]:
+        if product["weight"] is not None:
+            yield f"{product['weight']:.3f} x {format_number(product['price'])}"
+        else:
+            yield f"{format_number(product['quantity'])} x {format_number(product['price'])}"
+
+        product_total = format_number(product["total"])
+        name_width = self.line_width - len(product_total)
+        name = product["name"]
+        if display_width(name) + len(product_total) + 1 > self.line_width:
+            *chunks, name = split_by_width(name, self.line_width - 1)
+            yield from chunks
+            if display_width(name) + len(product_total) + 1 > self.line_width:
+                yield name
+                name = ""
+        yield ljust(name, name_width) + product_total
+
+    def summary_lines(self, receipt: Receipt) -> Iterator[str]:
+        yield self.total_label + rjust(format_number(receipt["total"]), self.half_width)
+        yield (
+            self.payment_labels[PaymentType(receipt["payment"]["type"])]
+            + rjust(format_number(receipt["payment"]["amount"]), self.half_width)
+        )
+        yield self.rest_label + rjust(format_number(receipt["rest"]), self.half_width)
+
+    def lines(self, receipt: Receipt) -> Iterator[str]:
+        yield self.header
+        yield self.separator
+        for product in receipt["products"]:
+            yield from self.product_lines(product)
+        yield self.separator
+        yield from self.summary_lines(receipt)
+        yield self.separator
+        yield center(receipt["created_at"].strftime("%d.%m.%Y %H:%M"), self.line_width)
+        yield self.footer
+
+
+@lru_cache(maxsize=64)
+def get_layout(line_width: int) -> ReceiptLayout:
+    return ReceiptLayout(line_width)
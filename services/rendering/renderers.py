@@ -0,0 +1,113 @@
+import html
+import os
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+from dto import Receipt, ReceiptRenderFormat
+from services.rendering.layout import get_layout
+
+PUBLIC_RECEIPT_BASE_URL = os.environ.get("PUBLIC_RECEIPT_BASE_URL", "http://localhost:8000")
+RENDER_CHUNK_LINES = 256
+
+ESCPOS_INIT = b"\x1b@" + b"\x1bt\x11"  # Reset, then select the PC866 (Cyrillic) code page.
+ESCPOS_ALIGN_LEFT = b"\x1ba\x00"
+ESCPOS_ALIGN_CENTER = b"\x1ba\x01"
+ESCPOS_QR_SETUP = (
+    b"\x1d(k\x04\x001A2\x00"  # Model 2.
+    b"\x1d(k\x03\x001C\x06"  # Module size.
+    b"\x1d(k\x03\x001E1"  # Error correction level M.
+)
+ESCPOS_QR_PRINT = b"\x1d(k\x03\x001Q0"
+ESCPOS_FEED_AND_CUT = b"\x1bd\x03" + b"\x1dVB\x00"
+
+
+def qr_payload(receipt: Receipt) -> str:
+    return f"{PUBLIC_RECEIPT_BASE_URL}/receipt/{receipt['public_token']}"
+
+
+def chunk_lines(lines: Iterable[str]) -> Iterator[str]:
+    # Joins lines into chunks of RENDER_CHUNK_LINES, every chunk but the first starts with the newline ending the last.
+    chunk = []
+    separator = ""
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= RENDER_CHUNK_LINES:
+            yield separator + "\n".join(chunk)
+            separator = "\n"
+            chunk = []
+    if chunk:
+        yield separator + "\n".join(chunk)
+
+
+class ReceiptRenderer:
+    media_type = "text/plain; charset=utf-8"
+
+    def __init__(self, line_width: int):
+        self.layout = get_layout(line_width)
+
+    def stream(self, receipt: Receipt) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def render(self, receipt: Receipt) -> bytes:
+        return b"".join(self.stream(receipt))
+
+
+class TextRenderer(ReceiptRenderer):
+    def render_text(self, receipt: Receipt) -> str:
+        return "\n".join(self.layout.lines(receipt))
+
+    def stream(self, receipt: Receipt) -> Iterator[bytes]:
+        for chunk in chunk_lines(self.layout.lines(receipt)):
+            yield chunk.encode()
+
+
+class HTMLRenderer(ReceiptRenderer):
+    media_type = "text/html; charset=utf-8"
+
+    def stream(self, receipt: Receipt) -> Iterator[bytes]:
+        yield (
+            '<!DOCTYPE html>\n<html lang="uk">\n<head><meta charset="utf-8"><title>Чек</title></head>\n<body>\n'
+            f'<pre class="receipt" style="width: {self.layout.line_width}ch">'
+        ).encode()
+        for chunk in chunk_lines(html.escape(line) for line in self.layout.lines(receipt)):
+            yield chunk.encode()
+        yield f'</pre>\n<a href="{html.escape(qr_payload(receipt))}">QR</a>\n</body>\n</html>\n'.encode()
+
+
+class ESCPOSRenderer(ReceiptRenderer):
+    media_type = "application/octet-stream"
+
+    def stream(self, receipt: Receipt) -> Iterator[bytes]:
+        yield ESCPOS_INIT + ESCPOS_ALIGN_LEFT
+        for chunk in chunk_lines(self.layout.lines(receipt)):
+            yield chunk.encode("cp866", errors="replace")
+        yield b"\n"
+
+        payload = qr_payload(receipt).encode()
+        size = len(payload) + 3
+        yield (
+            ESCPOS_ALIGN_CENTER
+            + ESCPOS_QR_SETUP
+            + b"\x1d(k" + bytes([size % 256, size // 256]) + b"1P0" + payload
+            + ESCPOS_QR_PRINT
+            + ESCPOS_ALIGN_LEFT
+            + ESCPOS_FEED_AND_CUT
+        )
+
+
+class QRPayloadRenderer(ReceiptRenderer):
+    def stream(self, receipt: Receipt) -> Iterator[bytes]:
+        yield qr_payload(receipt).encode()
+
+
+RENDERERS = {
+    ReceiptRenderFormat.TEXT: TextRenderer,
+    ReceiptRenderFormat.HTML: HTMLRenderer,
+    ReceiptRenderFormat.ESCPOS: ESCPOSRenderer,
+    ReceiptRenderFormat.QR: QRPayloadRenderer,
+}
+
+
+@lru_cache(maxsize=256)
+def get_renderer(render_format: ReceiptRenderFormat, line_width: int) -> ReceiptRenderer:
+    return RENDERERS[render_format](line_width)
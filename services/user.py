@@ -1,26 +1,43 @@
+import os
 from typing import Optional
 
-from dto import User, UserCreate
+from fastapi import Depends, HTTPException
+
+from database import release_connection
+from dto import User, UserCreate, Principal
 from repositories import UserRepository
 from services.auth import AuthService
+from services.cache import TTLCache
+
+USER_ID_CACHE_SIZE = int(os.environ.get("USER_ID_CACHE_SIZE", 10_000))
+USER_ID_CACHE_TTL = float(os.environ.get("USER_ID_CACHE_TTL", 5 * 60))
 
 
 class UserService:
+    user_id_cache = TTLCache(maxsize=USER_ID_CACHE_SIZE, ttl=USER_ID_CACHE_TTL)
+
     @classmethod
     async def does_exist_by_login(cls, login: str) -> bool:
         return bool(await UserRepository.get_by_login(login=login))
 
     @classmethod
-    async def authenticate(cls, login: str, password: str) -> bool:
+    async def authenticate(cls, login: str, password: str) -> Optional[User]:
         user = await UserRepository.get_by_login(login=login)
         if not user:
-            return False
-        if not AuthService.verify_password(password, user["hashed_password"]):
-            return False
-        return True
+            return None
+        # A queued bcrypt verification must not hold a pooled connection.
+        await release_connection()
+        verified, new_hash = await AuthService.verify_and_update_password(password, user["hashed_password"])
+        if not verified:
+            return None
+        if new_hash is not None:
+            await UserRepository.update_password_hash(login, new_hash)
+        return user
 
     @classmethod
     async def create(cls, user: UserCreate) -> User:
+        # The existence check of the request is done; hashing the password needs no connection.
+        await release_connection()
         return await UserRepository.save(user)
 
     @classmethod
@@ -30,3 +47,17 @@ class UserService:
     @classmethod
     async def get_id_by_login(cls, login: str) -> Optional[int]:
         return await UserRepository.get_id_by_login(login)
+
+    @classmethod
+    async def get_principal(cls, payload: dict = Depends(AuthService.authenticate)) -> Principal:
+        login = payload["login"]
+        user_id = payload.get("user_id")
+        if user_id is None:
+            # Tokens issued before user_id was added to the claims.
+            user_id = cls.user_id_cache.get(login)
+            if user_id is None:
+                user_id = await UserRepository.get_id_by_login(login)
+                if user_id is None:
+                    raise HTTPException(status_code=403, detail="Token is invalid or expired")
+                cls.user_id_cache.set(login, user_id)
+        return Principal(user_id=user_id, login=login)
@@ -0,0 +1,347 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from contextlib import suppress
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Deque, Iterator, List, Optional, Tuple
+
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from dto import PendingReceipt, ReceiptCreate, Payment, PaymentType, ProductAggregated
+from repositories import ReceiptRepository
+
+RECEIPT_WRITE_BEHIND = os.environ.get("RECEIPT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+RECEIPT_WRITE_BEHIND_DIRECTORY = os.environ.get("RECEIPT_WRITE_BEHIND_DIRECTORY", "data/write-behind")
+RECEIPT_WRITE_BEHIND_BATCH_SIZE = int(os.environ.get("RECEIPT_WRITE_BEHIND_BATCH_SIZE", 500))
+# How long the consumer waits for more receipts before committing a partial batch.
+RECEIPT_WRITE_BEHIND_MAX_DELAY = float(os.environ.get("RECEIPT_WRITE_BEHIND_MAX_DELAY", 0.01))
+# A fully committed log is truncated once it grows past this size.
+RECEIPT_WRITE_BEHIND_LOG_MAX_BYTES = int(os.environ.get("RECEIPT_WRITE_BEHIND_LOG_MAX_BYTES", 64 * 1024 * 1024))
+RECEIPT_WRITE_BEHIND_STOP_TIMEOUT = float(os.environ.get("RECEIPT_WRITE_BEHIND_STOP_TIMEOUT", 30))
+# New receipts are turned away while this many logged receipts wait to be committed.
+RECEIPT_WRITE_BEHIND_MAX_BACKLOG = int(os.environ.get("RECEIPT_WRITE_BEHIND_MAX_BACKLOG", 10_000))
+# Receipts Postgres rejects for good, in the log format so they can be fixed and replayed by hand.
+RECEIPT_WRITE_BEHIND_DEAD_LETTER_FILE = "dead-letter.log"
+# Connection exceptions, transaction rollbacks such as deadlocks, insufficient resources and operator intervention.
+TRANSIENT_SQLSTATE_PREFIXES = ("08", "40", "53", "57P")
+RECEIPT_ID_BLOCK_SIZE = int(os.environ.get("RECEIPT_ID_BLOCK_SIZE", 1000))
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBacklogFull(Exception):
+    pass
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, (OSError, asyncio.TimeoutError, PoolTimeoutError)):
+        return True
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        sqlstate = getattr(error.orig, "sqlstate", None)
+        return sqlstate is not None and sqlstate.startswith(TRANSIENT_SQLSTATE_PREFIXES)
+    return False
+
+
+def encode_pending(pending: PendingReceipt) -> bytes:
+    return json.dumps(pending, default=str, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_pending(line: bytes) -> PendingReceipt:
+    data = json.loads(line)
+    receipt = data["receipt"]
+    return PendingReceipt(
+        id=data["id"],
+        user_id=data["user_id"],
+        created_at=datetime.fromisoformat(data["created_at"]),
+        public_token=data["public_token"],
+        receipt=ReceiptCreate(
+            products=[
+                ProductAggregated(
+                    name=product["name"],
+                    price=Decimal(product["price"]),
+                    quantity=product["quantity"],
+                    weight=Decimal(product["weight"]) if product["weight"] is not None else None,
+                    total=Decimal(product["total"]),
+                )
+                for product in receipt["products"]
+            ],
+            payment=Payment(type=PaymentType(receipt["payment"]["type"]), amount=Decimal(receipt["payment"]["amount"])),
+            total=Decimal(receipt["total"]),
+            rest=Decimal(receipt["rest"]),
+        ),
+    )
+
+
+def read_checkpoint(path: str) -> int:
+    try:
+        with open(path + ".checkpoint") as file:
+            return int(file.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path: str, offset: int) -> None:
+    with open(path + ".checkpoint.tmp", "w") as file:
+        file.write(str(offset))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(path + ".checkpoint.tmp", path + ".checkpoint")
+
+
+def read_log(path: str, offset: int) -> Iterator[Tuple[int, PendingReceipt]]:
+    with open(path, "rb") as file:
+        file.seek(offset)
+        for line in file:
+            offset += len(line)
+            if not line.endswith(b"\n"):
+                # Torn write of a receipt that was never acknowledged.
+                break
+            yield offset, decode_pending(line)
+
+
+class ReceiptIdAllocator:
+    def __init__(self, block_size: int = RECEIPT_ID_BLOCK_SIZE):
+        self.block_size = block_size
+        self._ids: Deque[int] = deque()
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        if not self._ids:
+            async with self._lock:
+                if not self._ids:
+                    self._ids.extend(await ReceiptRepository.reserve_ids(self.block_size))
+        return self._ids.popleft()
+
+
+class ReceiptLog:
+    # Append-only log of accepted receipts. Concurrent appends share one write and fsync.
+    def __init__(self, path: str):
+        self.path = path
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        # Locked under a temporary name, so recovery in other processes never claims a live log.
+        self._file = open(path + ".new", "ab")
+        fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.replace(path + ".new", path)
+
+    async def append(self, line: bytes) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((line, future))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self) -> None:
+        while self._pending:
+            batch, self._pending = self._pending, []
+            async with self._lock:
+                try:
+                    offsets = await asyncio.to_thread(self._write, [line for line, _ in batch])
+                except OSError as e:
+                    for _, future in batch:
+                        future.set_exception(e)
+                    continue
+            for (_, future), offset in zip(batch, offsets):
+                future.set_result(offset)
+
+    def _write(self, lines: List[bytes]) -> List[int]:
+        start = position = self._file.tell()
+        offsets = []
+        try:
+            for line in lines:
+                self._file.write(line)
+                position += len(line)
+                offsets.append(position)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except OSError:
+            self._file.truncate(start)
+            raise
+        return offsets
+
+    async def truncate_if_committed(self, offset: int) -> bool:
+        async with self._lock:
+            if offset != self._file.tell() or offset < RECEIPT_WRITE_BEHIND_LOG_MAX_BYTES:
+                return False
+            await asyncio.to_thread(self._truncate)
+            return True
+
+    def _truncate(self) -> None:
+        self._file.truncate(0)
+        self._file.seek(0)
+        os.fsync(self._file.fileno())
+        write_checkpoint(self.path, 0)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ReceiptWriteBehind:
+    def __init__(
+            self,
+            directory: str = RECEIPT_WRITE_BEHIND_DIRECTORY,
+            batch_size: int = RECEIPT_WRITE_BEHIND_BATCH_SIZE,
+            max_delay: float = RECEIPT_WRITE_BEHIND_MAX_DELAY,
+            max_backlog: int = RECEIPT_WRITE_BEHIND_MAX_BACKLOG,
+    ):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_backlog = max_backlog
+        self.dead_letter_path = os.path.join(directory, RECEIPT_WRITE_BEHIND_DEAD_LETTER_FILE)
+        self.ids = ReceiptIdAllocator()
+        self.log: Optional[ReceiptLog] = None
+        self.committed = 0
+        self.dead_lettered = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        await self.recover()
+        self.log = ReceiptLog(os.path.join(self.directory, f"receipts-{os.getpid()}-{uuid.uuid4().hex}.log"))
+        self._queue = asyncio.Queue()
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def stop(self, timeout: float = RECEIPT_WRITE_BEHIND_STOP_TIMEOUT) -> None:
+        # Also called after a failed start, when only part of it is set up.
+        if self.log is None:
+            return
+        drained = False
+        if self._consumer is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+                drained = True
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "%d receipts left uncommitted, they will be replayed on the next start", self._queue.qsize(),
+                )
+            self._consumer.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._consumer
+        self.log.close()
+        if drained:
+            os.remove(self.log.path)
+            if os.path.exists(self.log.path + ".checkpoint"):
+                os.remove(self.log.path + ".checkpoint")
+
+    async def recover(self) -> int:
+        # Replays logs left behind by processes that stopped before committing them. Receipts committed after the
+        # last checkpoint are inserted again and skipped on their primary key, so each is stored exactly once.
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.directory, "receipts-*.log"))):
+            try:
+                file = open(path, "rb")
+            except FileNotFoundError:
+                continue
+            with file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                batch = []
+                for offset, pending in read_log(path, read_checkpoint(path)):
+                    batch.append(pending)
+                    if len(batch) >= self.batch_size:
+                        replayed += await self._save(batch)
+                        write_checkpoint(path, offset)
+                        batch = []
+                if batch:
+                    replayed += await self._save(batch)
+                os.remove(path)
+                if os.path.exists(path + ".checkpoint"):
+                    os.remove(path + ".checkpoint")
+            logger.info("Replayed receipt log %s", path)
+        return replayed
+
+    async def submit(self, receipt: ReceiptCreate, user_id: int) -> PendingReceipt:
+        # The log keeps growing while Postgres is down or slow; past the limit clients are asked to retry later.
+        if self._queue.qsize() >= self.max_backlog:
+            raise WriteBehindBacklogFull(f"{self._queue.qsize()} receipts are waiting to be committed")
+        pending = PendingReceipt(
+            id=await self.ids.next_id(),
+            user_id=user_id,
+            created_at=datetime.now(timezone.utc),
+            public_token=str(uuid.uuid4()),
+            receipt=receipt,
+        )
+        offset = await self.log.append(encode_pending(pending))
+        self._queue.put_nowait((offset, pending))
+        return pending
+
+    def metrics(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_backlog": self.max_backlog,
+            "committed": self.committed,
+            "dead_lettered": self.dead_lettered,
+        }
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._commit(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _commit(self, batch: List[Tuple[int, PendingReceipt]]) -> None:
+        delay = 0.1
+        while True:
+            try:
+                await self._save([pending for _, pending in batch])
+                break
+            except Exception:
+                # Only transient errors get here. The receipts are safe in the log; keep retrying so they are
+                # committed in order.
+                logger.exception("Committing %d logged receipts failed, retrying in %.1fs", len(batch), delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 5)
+        self.committed += len(batch)
+        offset = batch[-1][0]
+        if not await self.log.truncate_if_committed(offset):
+            await asyncio.to_thread(write_checkpoint, self.log.path, offset)
+
+    async def _save(self, batch: List[PendingReceipt]) -> int:
+        # Transient errors are raised to be retried. Otherwise the batch is split up, so only the receipts Postgres
+        # rejects go to the dead-letter file; receipts stored before a retry are skipped on their primary key.
+        try:
+            return await ReceiptRepository.save_pending(batch)
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            if len(batch) == 1:
+                logger.exception("Receipt %d was rejected, moving it to %s", batch[0]["id"], self.dead_letter_path)
+                await asyncio.to_thread(self._dead_letter, batch[0])
+                self.dead_lettered += 1
+                return 0
+        middle = len(batch) // 2
+        return await self._save(batch[:middle]) + await self._save(batch[middle:])
+
+    def _dead_letter(self, pending: PendingReceipt) -> None:
+        with open(self.dead_letter_path, "ab") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            file.write(encode_pending(pending))
+            file.flush()
+            os.fsync(file.fileno())
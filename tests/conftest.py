@@ -0,0 +1,61 @@
+import os
+import uuid
+
+# The defaults in services.auth are placeholders that PyJWT rejects.
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import main  # noqa: E402
+from database import init_db  # noqa: E402
+from database.config import engine  # noqa: E402
+from dto import UserCreate  # noqa: E402
+from services import AuthService, UserService  # noqa: E402
+from services.rate_limit import InMemoryRateLimitStore, RateLimiter  # noqa: E402
+
+_migrated = False
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def rate_limit_store():
+    RateLimiter.set_store(InMemoryRateLimitStore())
+    yield RateLimiter.store
+
+
+@pytest.fixture
+async def database():
+    # Tests that need Postgres use the POSTGRES_* and DB_HOST settings of the app and are skipped without it.
+    global _migrated
+    try:
+        async with engine.connect():
+            pass
+    except (OSError, ConnectionError) as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres is not reachable: {e}")
+    if not _migrated:
+        await init_db()
+        _migrated = True
+    yield engine
+    # Pooled connections are bound to the event loop of the test.
+    await engine.dispose()
+
+
+@pytest.fixture
+async def client():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+async def user(database):
+    login = f"test-{uuid.uuid4().hex[:12]}"
+    created = await UserService.create(UserCreate(login=login, name=login, password="test-password"))
+    token = AuthService.create_access_token({"login": login, "user_id": created["id"]})
+    return {**created, "password": "test-password", "headers": {"Authorization": f"Bearer {token}"}}
@@ -0,0 +1,64 @@
+import uuid
+
+import pytest
+
+from services import AuthService
+
+pytestmark = pytest.mark.anyio
+
+RECEIPT = {
+    "products": [{"name": "checkout-product", "price": "1.50", "quantity": 2}],
+    "payment": {"type": "cash", "amount": "100.00"},
+}
+
+
+async def count_checkouts(database, request) -> int:
+    before = database.pool.checkouts_total
+    response = await request()
+    assert response.status_code == 200, response.text
+    return database.pool.checkouts_total - before
+
+
+@pytest.fixture
+def hashing_checkouts(database, monkeypatch):
+    # Connections checked out while a password is hashed or verified.
+    held = []
+    hasher = AuthService.password_hasher
+    hash_password, verify_and_update = hasher.hash, hasher.verify_and_update
+
+    async def hash_(password):
+        held.append(database.pool.checkedout())
+        return await hash_password(password)
+
+    async def verify_and_update_(password, hashed_password):
+        held.append(database.pool.checkedout())
+        return await verify_and_update(password, hashed_password)
+
+    monkeypatch.setattr(hasher, "hash", hash_)
+    monkeypatch.setattr(hasher, "verify_and_update", verify_and_update_)
+    return held
+
+
+async def test_register_releases_the_connection_while_hashing(client, database, hashing_checkouts):
+    login = f"test-{uuid.uuid4().hex[:12]}"
+
+    checkouts = await count_checkouts(
+        database, lambda: client.post("/users/register", json={"login": login, "name": login, "password": "secret"}),
+    )
+
+    assert hashing_checkouts == [0]
+    assert checkouts <= 2
+
+
+async def test_login_releases_the_connection_while_verifying(client, database, user, hashing_checkouts):
+    checkouts = await count_checkouts(
+        database, lambda: client.post("/auth/token", data={"username": user["login"], "password": user["password"]}),
+    )
+
+    assert hashing_checkouts == [0]
+    assert checkouts <= 2
+
+
+async def test_receipt_endpoints_use_one_connection(client, database, user):
+    assert await count_checkouts(database, lambda: client.post("/receipt/", json=RECEIPT, headers=user["headers"])) == 1
+    assert await count_checkouts(database, lambda: client.get("/receipt/", headers=user["headers"])) == 1
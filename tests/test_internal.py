@@ -0,0 +1,26 @@
+import pytest
+
+import routes.internal
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_health_is_public(client):
+    response = await client.get("/internal/health")
+
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/internal/pool", "/internal/caches", "/internal/metrics"])
+async def test_internal_endpoints_require_the_token(client, monkeypatch, path):
+    monkeypatch.setattr(routes.internal, "INTERNAL_API_TOKEN", "internal-secret")
+
+    assert (await client.get(path)).status_code == 403
+    assert (await client.get(path, headers={"Authorization": "Bearer wrong"})).status_code == 403
+    assert (await client.get(path, headers={"Authorization": "Bearer internal-secret"})).status_code == 200
+
+
+async def test_internal_endpoints_are_closed_without_a_configured_token(client, monkeypatch):
+    monkeypatch.setattr(routes.internal, "INTERNAL_API_TOKEN", "")
+
+    assert (await client.get("/internal/metrics", headers={"Authorization": "Bearer "})).status_code == 403
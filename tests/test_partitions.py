@@ -0,0 +1,32 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from database.partitions import PARTITION_MONTHS_AHEAD, add_months, check_partitions, ensure_future_partitions
+
+pytestmark = pytest.mark.anyio
+
+
+def test_add_months_crosses_years():
+    assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+
+
+async def test_check_passes_once_the_coming_months_have_partitions(database):
+    await ensure_future_partitions(database)
+
+    await check_partitions(database, PARTITION_MONTHS_AHEAD)
+
+
+async def test_check_fails_when_a_coming_month_has_no_partition(database):
+    with pytest.raises(RuntimeError, match="python -m database.partitions maintain"):
+        await check_partitions(database, PARTITION_MONTHS_AHEAD + 120)
+
+
+async def test_concurrent_maintenance_creates_each_partition_once(database):
+    # Further ahead than the migrations go, so the first run of the test races on partitions that don't exist yet.
+    months_ahead = PARTITION_MONTHS_AHEAD + 6
+    created = await asyncio.gather(*(ensure_future_partitions(database, months_ahead) for _ in range(4)))
+
+    assert all(names == created[0] for names in created)
@@ -0,0 +1,18 @@
+import uuid
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_malformed_token_is_not_found_even_with_a_matching_etag(client):
+    response = await client.get("/receipt/not-a-token", headers={"If-None-Match": '"not-a-token-32-text"'})
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("line_width", [0, 15, 81, 100_000])
+async def test_line_width_out_of_range_is_rejected(client, line_width):
+    response = await client.get(f"/receipt/{uuid.uuid4()}", params={"line_width": line_width})
+
+    assert response.status_code == 422
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi import Depends, FastAPI
+
+import main
+from benchmarks.stats import percentile
+from middleware import LoadSheddingMiddleware, RateLimitMiddleware, RateLimitRule
+from services import AuthService, UserService
+
+pytestmark = pytest.mark.anyio
+
+
+def make_client(app, address: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(address, 50000)), base_url="http://test")
+
+
+async def test_failed_logins_from_another_address_do_not_lock_the_user_out(monkeypatch):
+    async def authenticate(login, password):
+        return {"id": 1, "login": login} if password == "right" else None
+
+    monkeypatch.setattr(UserService, "authenticate", authenticate)
+    async with make_client(main.app, "10.0.0.1") as attacker, make_client(main.app, "10.0.0.2") as victim:
+        statuses = [
+            (await attacker.post("/auth/token", data={"username": "victim", "password": "wrong"})).status_code
+            for _ in range(20)
+        ]
+        assert 429 in statuses
+
+        response = await victim.post("/auth/token", data={"username": "victim", "password": "right"})
+        assert response.status_code == 200
+
+
+async def test_the_token_is_decoded_once_per_request(monkeypatch):
+    decoded = []
+    decode_token = AuthService.decode_token
+
+    def counting_decode_token(token):
+        decoded.append(token)
+        return decode_token(token)
+
+    monkeypatch.setattr(AuthService, "decode_token", counting_decode_token)
+    app = FastAPI()
+
+    @app.get("/me")
+    async def me(payload: dict = Depends(AuthService.authenticate)):
+        return {"login": payload["login"]}
+
+    token = AuthService.create_access_token({"login": "user", "user_id": 1})
+    async with make_client(RateLimitMiddleware(app), "10.0.0.1") as client:
+        response = await client.get("/me", headers={"Authorization": f"Bearer {token}"})
+        forged = await client.get("/me", headers={"Authorization": "Bearer forged"})
+
+    assert response.json() == {"login": "user"}
+    assert forged.status_code == 403
+    assert decoded == [token, "forged"]
+
+
+async def run_abuse(app) -> dict:
+    # Regular clients send 20 requests a second each, 40 abusive ones send as fast as they get answers.
+    statuses = {"abusive": [], "regular": []}
+    latencies = []
+    deadline = time.perf_counter() + 1
+
+    async def abuse(client):
+        while time.perf_counter() < deadline:
+            statuses["abusive"].append((await client.get("/")).status_code)
+            await asyncio.sleep(0.005)
+
+    async def regular(client):
+        while time.perf_counter() < deadline:
+            started_at = time.perf_counter()
+            statuses["regular"].append((await client.get("/")).status_code)
+            latencies.append(time.perf_counter() - started_at)
+            await asyncio.sleep(0.05)
+
+    abusers = [make_client(app, f"10.1.0.{index}") for index in range(4)]
+    users = [make_client(app, f"10.0.0.{index}") for index in range(2)]
+    try:
+        await asyncio.gather(
+            *(abuse(client) for client in abusers for _ in range(10)),
+            *(regular(client) for client in users),
+        )
+    finally:
+        for client in abusers + users:
+            await client.aclose()
+    return {**statuses, "p99": percentile(latencies, 0.99)}
+
+
+async def test_regular_latency_stays_bounded_under_abuse():
+    # Four connections of 10 ms each stand in for the database pool.
+    connections = asyncio.Semaphore(4)
+
+    async def app(scope, receive, send):
+        async with connections:
+            await asyncio.sleep(0.01)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    unprotected = await run_abuse(app)
+    protected = await run_abuse(RateLimitMiddleware(
+        LoadSheddingMiddleware(app, max_concurrency=4, queue_timeout=0.05, max_queue=8),
+        rules=[RateLimitRule("ip", "ip", rate=30, burst=2)],
+    ))
+
+    # At worst a request waits out the queue timeout before it is served or shed.
+    assert protected["p99"] < 0.1
+    assert unprotected["p99"] > 2 * protected["p99"]
+    assert protected["abusive"].count(429) > protected["abusive"].count(200)
+    assert protected["regular"].count(200) >= 0.9 * len(protected["regular"])
@@ -0,0 +1,57 @@
+import time
+
+import httpx
+import pytest
+from starlette.responses import PlainTextResponse
+
+import middleware.read_consistency
+from database import ReadConsistency, get_read_consistency, mark_written
+from database.replicas import DB_REPLICA_READ_YOUR_WRITES_SECONDS
+from middleware import ReadConsistencyMiddleware
+from middleware.read_consistency import READ_CONSISTENCY_COOKIE
+
+pytestmark = pytest.mark.anyio
+
+
+async def app(scope, receive, send):
+    if scope["path"] == "/write":
+        mark_written()
+    consistency = get_read_consistency()
+    await PlainTextResponse("primary" if consistency.requires_primary() else "replica")(scope, receive, send)
+
+
+def make_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=ReadConsistencyMiddleware(app)), base_url="http://test")
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    monkeypatch.setattr(middleware.read_consistency, "has_replicas", lambda: True)
+    async with make_client() as client:
+        yield client
+
+
+def test_only_a_recent_past_write_requires_the_primary():
+    now = time.time()
+    assert not ReadConsistency().requires_primary()
+    assert ReadConsistency(now - 1).requires_primary()
+    assert not ReadConsistency(now - DB_REPLICA_READ_YOUR_WRITES_SECONDS - 1).requires_primary()
+    assert not ReadConsistency(now + 60).requires_primary()
+
+
+async def test_reads_after_a_write_go_to_the_primary(client):
+    assert (await client.get("/read")).text == "replica"
+
+    written = await client.post("/write")
+    assert READ_CONSISTENCY_COOKIE in written.cookies
+
+    # A fresh client stands in for a request served by another worker; only the cookie carries the write.
+    async with make_client() as other:
+        assert (await other.get("/read")).text == "replica"
+        other.cookies.set(READ_CONSISTENCY_COOKIE, written.cookies[READ_CONSISTENCY_COOKIE])
+        assert (await other.get("/read")).text == "primary"
+
+
+async def test_malformed_marker_is_ignored(client):
+    client.cookies.set(READ_CONSISTENCY_COOKIE, "nan")
+    assert (await client.get("/read")).text == "replica"
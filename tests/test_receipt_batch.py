@@ -0,0 +1,52 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import insert
+
+from database import Receipt as ReceiptDBModel
+from repositories.batching import MAX_BIND_PARAMETERS, chunked_rows
+from routes.receipt import RECEIPT_BATCH_MAX_SIZE
+
+pytestmark = pytest.mark.anyio
+
+
+def make_item(index: int, run_id: str, lines: int = 3) -> dict:
+    return {
+        "idempotency_key": f"{run_id}-{index}",
+        "products": [
+            {"name": f"batch-product-{line}", "price": "1.50", "quantity": 2}
+            for line in range(lines)
+        ],
+        "payment": {"type": "cash", "amount": "100.00"},
+    }
+
+
+def test_receipt_inserts_of_a_full_batch_stay_under_the_parameter_limit():
+    # Shaped like the rows ReceiptRepository._insert builds; public_token is filled in by its Python-side default.
+    row = dict(
+        id=1, user_id=1, total=Decimal("3.00"), amount_paid=Decimal("5.00"), payment_type="cash",
+        rest=Decimal("2.00"), idempotency_key="key", item_count=1, product_names=["milk"],
+    )
+    chunks = list(chunked_rows(ReceiptDBModel, [dict(row) for _ in range(RECEIPT_BATCH_MAX_SIZE)]))
+
+    assert sum(len(chunk) for chunk in chunks) == RECEIPT_BATCH_MAX_SIZE
+    for chunk in chunks:
+        compiled = insert(ReceiptDBModel).values(chunk).compile(dialect=postgresql.dialect())
+        assert len(compiled.params) <= MAX_BIND_PARAMETERS
+
+
+async def test_batch_of_the_maximum_size_is_created(client, user):
+    run_id = uuid.uuid4().hex
+    items = [make_item(index, run_id) for index in range(RECEIPT_BATCH_MAX_SIZE)]
+
+    response = await client.post("/receipt/batch", json=items, headers=user["headers"])
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == RECEIPT_BATCH_MAX_SIZE
+    assert {result["status"] for result in body["data"]} == {"created"}
+
+    retried = await client.post("/receipt/batch", json=items[:10], headers=user["headers"])
+    assert {result["status"] for result in retried.json()["data"]} == {"duplicate"}
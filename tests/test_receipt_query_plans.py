@@ -0,0 +1,105 @@
+import itertools
+import json
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select, text
+
+from database import Receipt as ReceiptDBModel
+from dto import PaymentType, ReceiptFilters
+from repositories import ReceiptRepository
+
+pytestmark = pytest.mark.anyio
+
+FIXTURE_LOGIN_PREFIX = "explain-fixture-"
+FIXTURE_USERS = 1_000
+FIXTURE_RECEIPTS = 200_000
+OPTIONAL_FILTERS = {
+    "min_created_at": lambda now: now - timedelta(days=7),
+    "max_created_at": lambda now: now,
+    "payment_type": lambda now: PaymentType.CASH,
+    "min_total": lambda now: Decimal("10.00"),
+    "max_total": lambda now: Decimal("500.00"),
+}
+FILTER_COMBINATIONS = [
+    combination
+    for size in range(len(OPTIONAL_FILTERS) + 1)
+    for combination in itertools.combinations(OPTIONAL_FILTERS, size)
+]
+
+
+@pytest.fixture
+async def fixture_user_id(database):
+    # Seeded once per database; receipts go into the current month so they land in an existing partition.
+    async with database.begin() as connection:
+        user_id = (await connection.execute(
+            text("SELECT min(id) FROM users WHERE login LIKE :prefix"), {"prefix": f"{FIXTURE_LOGIN_PREFIX}%"}
+        )).scalar()
+        if user_id is None:
+            await connection.execute(text(
+                "INSERT INTO users (name, login, hashed_password) "
+                "SELECT 'explain', :prefix || n, 'not-a-hash' FROM generate_series(1, :users) AS n"
+            ), {"prefix": FIXTURE_LOGIN_PREFIX, "users": FIXTURE_USERS})
+            user_id = (await connection.execute(
+                text("SELECT min(id) FROM users WHERE login LIKE :prefix"), {"prefix": f"{FIXTURE_LOGIN_PREFIX}%"}
+            )).scalar()
+            await connection.execute(text(
+                "INSERT INTO receipts (user_id, created_at, total, amount_paid, payment_type, rest, public_token) "
+                "SELECT :first_user + n % :users, "
+                "date_trunc('month', now()) + random() * (now() - date_trunc('month', now())), "
+                "round((random() * 1000)::numeric, 2), 1000, "
+                "CASE WHEN n % 2 = 0 THEN 'cash' ELSE 'cashless' END, 0, md5(n::text || random()::text) "
+                "FROM generate_series(1, :receipts) AS n"
+            ), {"first_user": user_id, "users": FIXTURE_USERS, "receipts": FIXTURE_RECEIPTS})
+        await connection.execute(text("ANALYZE receipts"))
+    return user_id
+
+
+@pytest.fixture
+async def empty_partitions(database, fixture_user_id) -> set:
+    # The partitions of the coming months are empty, and scanning those sequentially is the cheapest plan.
+    async with database.connect() as connection:
+        return set((await connection.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = 'receipts' AND child.reltuples <= 0"
+        ))).scalars().all())
+
+
+def seq_scans(plan: dict, ignored: set) -> list:
+    scans = []
+    relation = plan.get("Relation Name", "")
+    if plan["Node Type"] == "Seq Scan" and relation.startswith("receipts") and relation not in ignored:
+        scans.append(relation)
+    for child in plan.get("Plans", []):
+        scans.extend(seq_scans(child, ignored))
+    return scans
+
+
+async def explain(database, statement) -> dict:
+    query = statement.compile(dialect=database.dialect, compile_kwargs={"literal_binds": True})
+    async with database.connect() as connection:
+        plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {query}")).scalar()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+@pytest.mark.parametrize("combination", FILTER_COMBINATIONS, ids=lambda c: "+".join(c) or "user_only")
+async def test_filtered_list_does_not_scan_receipts(database, fixture_user_id, empty_partitions, combination):
+    now = datetime.now(timezone.utc)
+    filters = ReceiptFilters(user_id=fixture_user_id, **{name: OPTIONAL_FILTERS[name](now) for name in combination})
+    statement = ReceiptRepository._apply_pagination(
+        ReceiptRepository._apply_filters(select(ReceiptDBModel.id), filters), filters
+    )
+
+    assert seq_scans(await explain(database, statement), empty_partitions) == []
+
+
+async def test_public_token_lookup_does_not_scan_receipts(database, fixture_user_id, empty_partitions):
+    filters = ReceiptFilters(public_token="00000000-0000-0000-0000-000000000000", limit=1)
+    statement = ReceiptRepository._apply_pagination(
+        ReceiptRepository._apply_filters(select(ReceiptDBModel.id), filters), filters
+    )
+
+    assert seq_scans(await explain(database, statement), empty_partitions) == []
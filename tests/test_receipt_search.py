@@ -0,0 +1,38 @@
+import uuid
+
+import pytest
+
+from dto import UserCreate
+from repositories.receipt import RECEIPT_SEARCH_MAX_PRODUCTS
+from services import AuthService, UserService
+
+pytestmark = pytest.mark.anyio
+
+
+def make_receipt(names) -> dict:
+    return {
+        "products": [{"name": name, "price": "1.00", "quantity": 1} for name in names],
+        "payment": {"type": "cash", "amount": "100000.00"},
+    }
+
+
+async def test_own_products_are_found_behind_better_catalog_matches(client, user):
+    run_id = uuid.uuid4().hex[:8]
+    login = f"test-{uuid.uuid4().hex[:12]}"
+    other = await UserService.create(UserCreate(login=login, name=login, password="test-password"))
+    other_headers = {
+        "Authorization": f"Bearer {AuthService.create_access_token({'login': login, 'user_id': other['id']})}",
+    }
+    # Exact matches bought by someone else outrank the user's product and fill the candidate cap.
+    names = [f"milk {run_id} {index}" for index in range(RECEIPT_SEARCH_MAX_PRODUCTS + 1)]
+    response = await client.post("/receipt/", json=make_receipt(names), headers=other_headers)
+    assert response.status_code == 200, response.text
+
+    own = f"oat drink with a dash of milk and something else {run_id}"
+    response = await client.post("/receipt/", json=make_receipt([own]), headers=user["headers"])
+    assert response.status_code == 200, response.text
+
+    response = await client.get("/receipt/search", params={"q": "milk"}, headers=user["headers"])
+
+    assert response.status_code == 200
+    assert [result["product"]["name"] for result in response.json()["data"]] == [own]
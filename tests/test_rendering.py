@@ -0,0 +1,53 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+from dto import ReceiptRenderFormat
+from services.rendering.renderers import RENDER_CHUNK_LINES, get_renderer
+
+LINE_WIDTH = 32
+
+
+def make_receipt(products: int, long_names: int = 0) -> dict:
+    # Two lines per product, three for each product whose name wraps, and nine around them.
+    return {
+        "id": 1,
+        "products": [
+            {
+                "name": ("a product name long enough to wrap " if index < long_names else "") + f"product {index}",
+                "price": Decimal("1.50"),
+                "quantity": 2,
+                "weight": None,
+                "total": Decimal("3.00"),
+            }
+            for index in range(products)
+        ],
+        "payment": {"type": "cash", "amount": Decimal("1000.00")},
+        "total": Decimal("3.00") * products,
+        "rest": Decimal("1000.00") - Decimal("3.00") * products,
+        "created_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "public_token": "00000000-0000-0000-0000-000000000000",
+    }
+
+
+@pytest.mark.parametrize("receipt", [
+    make_receipt(1),
+    make_receipt(123, long_names=1),
+    make_receipt(300),
+], ids=["short", "one_full_chunk", "several_chunks"])
+def test_streamed_text_matches_the_rendered_text(receipt):
+    renderer = get_renderer(ReceiptRenderFormat.TEXT, LINE_WIDTH)
+
+    chunks = list(renderer.stream(receipt))
+
+    assert b"".join(chunks).decode() == renderer.render_text(receipt)
+    assert all(chunks)
+
+
+def test_a_receipt_of_exactly_one_chunk_is_streamed_in_one_piece():
+    receipt = make_receipt(123, long_names=1)
+    renderer = get_renderer(ReceiptRenderFormat.TEXT, LINE_WIDTH)
+    assert len(renderer.render_text(receipt).split("\n")) == RENDER_CHUNK_LINES
+
+    assert list(renderer.stream(receipt)) == [renderer.render_text(receipt).encode()]
@@ -0,0 +1,45 @@
+import pytest
+
+from database import UnitOfWork
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSession:
+    def __init__(self, fail_commit: bool = False):
+        self.fail_commit = fail_commit
+
+    async def commit(self):
+        if self.fail_commit:
+            raise RuntimeError("commit failed")
+
+    async def rollback(self):
+        pass
+
+
+async def test_after_commit_callbacks_run_after_a_successful_commit():
+    calls = []
+    uow = UnitOfWork(FakeSession())
+
+    async def callback():
+        calls.append("called")
+
+    uow.after_commit.append(callback)
+    assert calls == []
+    await uow.commit()
+    assert calls == ["called"]
+
+
+async def test_after_commit_callbacks_are_dropped_when_the_commit_fails():
+    calls = []
+    uow = UnitOfWork(FakeSession(fail_commit=True))
+
+    async def callback():
+        calls.append("called")
+
+    uow.after_commit.append(callback)
+    with pytest.raises(RuntimeError):
+        await uow.commit()
+    await uow.rollback()
+    assert calls == []
+    assert uow.after_commit == []
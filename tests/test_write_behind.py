@@ -0,0 +1,121 @@
+import asyncio
+from decimal import Decimal
+from itertools import count
+
+import pytest
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from dto import Payment, PaymentType, ProductAggregated, ReceiptCreate
+from repositories import ProductRepository, ReceiptRepository
+from services import ReceiptService
+from services.cache import TTLCache
+from services.write_behind import (
+    ReceiptWriteBehind, WriteBehindBacklogFull, decode_pending, is_transient_error,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+class PostgresError(Exception):
+    def __init__(self, sqlstate: str):
+        super().__init__(sqlstate)
+        self.sqlstate = sqlstate
+
+
+def make_receipt() -> ReceiptCreate:
+    return ReceiptCreate(
+        products=[
+            ProductAggregated(name="milk", price=Decimal("1.50"), quantity=2, weight=None, total=Decimal("3.00")),
+        ],
+        payment=Payment(type=PaymentType.CASH, amount=Decimal("5.00")),
+        total=Decimal("3.00"),
+        rest=Decimal("2.00"),
+    )
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    # Stands in for Postgres: receipts with a rejected id fail the whole batch, like a constraint violation does.
+    saved = {"ids": [], "rejected": set(), "release": asyncio.Event()}
+    saved["release"].set()
+    ids = count(1)
+
+    async def reserve_ids(size):
+        return [next(ids) for _ in range(size)]
+
+    async def save_pending(pending):
+        await saved["release"].wait()
+        if any(receipt["id"] in saved["rejected"] for receipt in pending):
+            raise IntegrityError("INSERT", None, PostgresError("23505"))
+        saved["ids"].extend(receipt["id"] for receipt in pending)
+        return len(pending)
+
+    monkeypatch.setattr(ReceiptRepository, "reserve_ids", reserve_ids)
+    monkeypatch.setattr(ReceiptRepository, "save_pending", save_pending)
+    return saved
+
+
+@pytest.fixture
+async def write_behind(tmp_path, saved):
+    write_behind = ReceiptWriteBehind(directory=str(tmp_path), max_delay=0, max_backlog=3)
+    await write_behind.start()
+    yield write_behind
+    saved["release"].set()
+    await write_behind.stop(timeout=1)
+
+
+@pytest.mark.parametrize("error, transient", [
+    (ConnectionResetError(), True),
+    (asyncio.TimeoutError(), True),
+    (DBAPIError("INSERT", None, PostgresError("40P01")), True),
+    (DBAPIError("INSERT", None, PostgresError("08006")), True),
+    (IntegrityError("INSERT", None, PostgresError("23505")), False),
+    (ValueError(), False),
+])
+def test_only_connection_and_concurrency_errors_are_transient(error, transient):
+    assert is_transient_error(error) is transient
+
+
+async def test_rejected_receipts_go_to_the_dead_letter_file(write_behind, saved):
+    saved["rejected"].add(3)
+    batch = [await write_behind.submit(make_receipt(), 1) for _ in range(3)]
+    await asyncio.wait_for(write_behind._queue.join(), 1)
+
+    assert sorted(saved["ids"]) == [1, 2]
+    with open(write_behind.dead_letter_path, "rb") as file:
+        assert [decode_pending(line)["id"] for line in file] == [batch[2]["id"]]
+    assert write_behind.metrics()["dead_lettered"] == 1
+
+
+async def test_receipts_are_turned_away_past_the_backlog_limit(write_behind, saved):
+    saved["release"].clear()
+    with pytest.raises(WriteBehindBacklogFull):
+        for _ in range(write_behind.max_backlog * 2):
+            await write_behind.submit(make_receipt(), 1)
+
+    assert write_behind.metrics()["queued"] == write_behind.max_backlog
+
+
+async def test_failed_start_leaves_write_behind_disabled(tmp_path, saved, monkeypatch):
+    write_behind = ReceiptWriteBehind(directory=str(tmp_path))
+
+    async def recover():
+        raise ConnectionRefusedError()
+
+    monkeypatch.setattr(write_behind, "recover", recover)
+    with pytest.raises(ConnectionRefusedError):
+        await ReceiptService.start_write_behind(write_behind)
+
+    assert ReceiptService.write_behind is None
+    await write_behind.stop()
+
+
+async def test_acknowledged_receipts_show_catalog_prices(write_behind, monkeypatch):
+    catalog_cache = TTLCache(maxsize=10)
+    catalog_cache.set("milk", (1, Decimal("1.40")))
+    monkeypatch.setattr(ProductRepository, "catalog_cache", catalog_cache)
+    monkeypatch.setattr(ReceiptService, "write_behind", write_behind)
+
+    created = await ReceiptService.create(make_receipt(), 1)
+
+    assert [product["price"] for product in created["products"]] == [Decimal("1.40")]